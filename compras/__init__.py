@@ -0,0 +1,19 @@
+"""
+Núcleo del agente de compras, sin dependencias de UI.
+
+    ingesta       Erply, histórico mensual, transacciones e histórico local
+    limpieza      picos y quiebres de stock en el histórico (opcional)
+    features      features por SKU (lags, costo, temporada, estacionalidad)
+    modelo        Ridge global y pronóstico por SKU
+    segmentacion  segmentación por reglas y GMM de diagnóstico
+    politica      tabla de compra del mes de planeación
+    exportacion   CSV / XLSX / Parquet
+    multitienda   varias tiendas en paralelo y traspasos
+    precalculo    plan precalculado en la caché local (cron)
+    artefacto     modelo ajustado en disco (versionado, arreglos en memory map)
+    cli           python -m compras <comando>
+
+Streamlit solo se importa en app.py; scikit-learn, openpyxl y lxml solo cuando
+se usan.
+"""
+from .config import APP_VERSION
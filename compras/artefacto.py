@@ -0,0 +1,201 @@
+"""
+Artefacto del modelo ajustado: el estado de catálogo de una corrida (Ridge,
+estacionalidad, percentiles, cuantiles de residuales, GMM y scaler) en una
+carpeta con manifest.json y un .npy por arreglo. Los arreglos se abren con
+memory map, así que la UI, la CLI y los workers comparten las mismas páginas
+del archivo en lugar de copiar el modelo en cada proceso.
+"""
+import json
+import os
+import shutil
+
+import pandas as pd
+import numpy as np
+
+from .config import APP_VERSION
+from .helpers import write_atomic_json
+from .modelo import NumpyRidgeRegression
+
+
+# =========================
+# ARTEFACTO DEL MODELO
+# =========================
+FORMATO_ARTEFACTO = 1
+
+# Llaves del contexto que guarda el artefacto; el resto (features, clusters GMM
+# del catálogo) son datos de la corrida y no parámetros ajustados.
+CLAVES_ARTEFACTO = [
+    "modelo", "feature_cols", "fechas_24m", "percentiles", "estacionalidad_compra",
+    "residual_q", "costo_global", "gmm_modelo",
+]
+
+
+def artifact_manifest_path(path):
+    return os.path.join(path, "manifest.json")
+
+
+def save_model_artifact(ctx, path, clave):
+    """
+    Escribe el estado ajustado de `ctx` en la carpeta `path`, marcado con
+    APP_VERSION y la huella `clave` de las entradas. Se escribe en una carpeta
+    temporal y se publica con un rename. Devuelve el manifiesto.
+    """
+    arreglos = {}
+    manifest = {
+        "formato": FORMATO_ARTEFACTO,
+        "version": APP_VERSION,
+        "clave": clave,
+        "creado": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "feature_cols": list(ctx.get("feature_cols") or []),
+        "fechas_24m": [f"{pd.Timestamp(f):%Y-%m-%d}" for f in ctx.get("fechas_24m", [])],
+        "costo_global": None,
+        "ridge": None,
+        "residual_q": None,
+        "gmm": None,
+    }
+
+    modelo = ctx.get("modelo")
+    if modelo is not None:
+        manifest["ridge"] = {"alpha": float(modelo.alpha), "feature_names": list(modelo.feature_names_)}
+        arreglos["ridge_coef"] = np.asarray(modelo.coef_, dtype=float)
+        arreglos["ridge_intercept"] = np.array([modelo.intercept_], dtype=float)
+
+    if "percentiles" in ctx:
+        arreglos["percentiles"] = np.asarray(ctx["percentiles"], dtype=float)
+
+    if "costo_global" in ctx and pd.notna(ctx["costo_global"]):
+        manifest["costo_global"] = float(ctx["costo_global"])
+
+    if "estacionalidad_compra" in ctx:
+        matriz = ctx["estacionalidad_compra"]
+        arreglos["estacionalidad"] = matriz.to_numpy(dtype=float)
+        arreglos["estacionalidad_codigos"] = matriz.index.to_numpy().astype(str)
+        manifest["estacionalidad_meses"] = [int(m) for m in matriz.columns]
+
+    if "residual_q" in ctx:
+        residual_q = ctx["residual_q"]
+        arreglos["residual_q"] = residual_q.to_numpy(dtype=float)
+        manifest["residual_q"] = {
+            "segmentos": [str(s) for s in residual_q.index],
+            "niveles": [float(n) for n in residual_q.columns],
+            "nombre": residual_q.index.name,
+        }
+
+    gmm_modelo = ctx.get("gmm_modelo")
+    if gmm_modelo is not None:
+        scaler, gmm = gmm_modelo["scaler"], gmm_modelo["gmm"]
+        manifest["gmm"] = {"n_components": int(gmm.n_components), "covariance_type": gmm.covariance_type}
+        arreglos.update({
+            "gmm_weights": gmm.weights_,
+            "gmm_means": gmm.means_,
+            "gmm_covariances": gmm.covariances_,
+            "gmm_precisions_cholesky": gmm.precisions_cholesky_,
+            "scaler_mean": scaler.mean_,
+            "scaler_scale": scaler.scale_,
+            "scaler_var": scaler.var_,
+        })
+
+    manifest["arreglos"] = {
+        nombre: {"dtype": str(arr.dtype), "shape": list(arr.shape)} for nombre, arr in arreglos.items()
+    }
+
+    tmp = path.rstrip(os.sep) + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for nombre, arr in arreglos.items():
+        np.save(os.path.join(tmp, f"{nombre}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+    write_atomic_json(artifact_manifest_path(tmp), manifest)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return manifest
+
+
+def read_model_artifact_manifest(path):
+    with open(artifact_manifest_path(path), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def load_model_artifact(path, clave=None, con_gmm=True):
+    """
+    Contexto listo para build_sku_base / apply_purchase_policy a partir del
+    artefacto en `path`, sin reajustar nada. Los arreglos quedan en memory map
+    (solo lectura). Falla con ValueError si el artefacto es de otra versión o
+    formato, o si `clave` no coincide con la huella registrada. Con `con_gmm`
+    reconstruye el GMM y el scaler (importa scikit-learn).
+    """
+    manifest = read_model_artifact_manifest(path)
+    if manifest.get("formato") != FORMATO_ARTEFACTO:
+        raise ValueError(f"Formato de artefacto no soportado: {manifest.get('formato')}.")
+    if manifest.get("version") != APP_VERSION:
+        raise ValueError(f"El artefacto es de la versión {manifest.get('version')}, no de {APP_VERSION}.")
+    if clave is not None and manifest.get("clave") != clave:
+        raise ValueError("El artefacto se ajustó con otras entradas.")
+
+    arreglos = {
+        nombre: np.load(os.path.join(path, f"{nombre}.npy"), mmap_mode="r", allow_pickle=False)
+        for nombre in manifest["arreglos"]
+    }
+
+    ctx = {
+        "feature_cols": manifest["feature_cols"],
+        "fechas_24m": [pd.Timestamp(f) for f in manifest["fechas_24m"]],
+        "costo_global": np.nan if manifest["costo_global"] is None else manifest["costo_global"],
+    }
+
+    ctx["modelo"] = None
+    if manifest["ridge"] is not None:
+        modelo = NumpyRidgeRegression(alpha=manifest["ridge"]["alpha"])
+        modelo.coef_ = arreglos["ridge_coef"]
+        modelo.intercept_ = float(arreglos["ridge_intercept"][0])
+        modelo.feature_names_ = manifest["ridge"]["feature_names"]
+        modelo.is_fitted_ = True
+        ctx["modelo"] = modelo
+
+    if "percentiles" in arreglos:
+        ctx["percentiles"] = tuple(float(p) for p in arreglos["percentiles"])
+
+    if "estacionalidad" in arreglos:
+        ctx["estacionalidad_compra"] = pd.DataFrame(
+            arreglos["estacionalidad"],
+            index=pd.Index(arreglos["estacionalidad_codigos"].astype(object), name="Código"),
+            columns=manifest["estacionalidad_meses"],
+            copy=False,
+        )
+
+    if manifest["residual_q"] is not None:
+        ctx["residual_q"] = pd.DataFrame(
+            arreglos["residual_q"],
+            index=pd.Index(manifest["residual_q"]["segmentos"], name=manifest["residual_q"]["nombre"]),
+            columns=manifest["residual_q"]["niveles"],
+            copy=False,
+        )
+
+    if con_gmm:
+        ctx["gmm_modelo"] = rebuild_gmm(manifest["gmm"], arreglos) if manifest["gmm"] else None
+
+    return ctx
+
+
+def rebuild_gmm(meta, arreglos):
+    """GaussianMixture y StandardScaler ya ajustados a partir de sus parámetros."""
+    from sklearn.mixture import GaussianMixture
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    scaler.mean_ = arreglos["scaler_mean"]
+    scaler.scale_ = arreglos["scaler_scale"]
+    scaler.var_ = arreglos["scaler_var"]
+    scaler.n_features_in_ = len(scaler.mean_)
+
+    gmm = GaussianMixture(n_components=meta["n_components"], covariance_type=meta["covariance_type"])
+    gmm.weights_ = arreglos["gmm_weights"]
+    gmm.means_ = arreglos["gmm_means"]
+    gmm.covariances_ = arreglos["gmm_covariances"]
+    gmm.precisions_cholesky_ = arreglos["gmm_precisions_cholesky"]
+    gmm.n_features_in_ = gmm.means_.shape[1]
+    gmm.converged_ = True
+
+    return {"scaler": scaler, "gmm": gmm}
@@ -0,0 +1,215 @@
+"""Línea de comandos: python -m compras <comando>."""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from .config import (
+    APP_VERSION, DIR_CACHE, FORMATOS_EXPORTACION, MODULOS_PESADOS, PRESUPUESTO_IMPORTACION_S,
+)
+from .helpers import write_atomic_json
+from .ingesta import HistoryStore, prepare_hist, read_erply, read_hist
+from .multitienda import run_multi_store
+from .comparacion import run_comparison, synthetic_inputs
+from .precalculo import precompute_model_path, read_precompute_manifest, run_precompute
+from .artefacto import read_model_artifact_manifest
+
+
+# =========================
+# ARRANQUE
+# =========================
+def measure_core_import():
+    """
+    Importa el núcleo en un proceso nuevo (como un worker del pool o la CLI) y
+    devuelve los segundos de pandas + numpy, los del paquete y los módulos
+    pesados que quedaron cargados.
+    """
+    codigo = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        "import numpy, pandas\n"
+        "t1 = time.perf_counter()\n"
+        "import compras.cli\n"
+        "t2 = time.perf_counter()\n"
+        f"pesados = [m for m in {MODULOS_PESADOS!r} if m in sys.modules]\n"
+        "print(json.dumps({'base': t1 - t0, 'compras': t2 - t1, 'pesados': pesados}))\n"
+    )
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=raiz, capture_output=True, text=True, check=True
+    )
+    return json.loads(salida.stdout)
+
+
+# =========================
+# CLI
+# =========================
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description=f"Agente de compras {APP_VERSION}")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    multi = sub.add_parser("multi", help="Corre varias tiendas desde un manifiesto.")
+    multi.add_argument("--manifiesto", required=True, help="CSV/JSON con Tienda, Historico, Erply.")
+    multi.add_argument("--salida", default="salida", help="Carpeta de salida.")
+    multi.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, todos los núcleos).")
+    multi.add_argument("--modelo-por-tienda", action="store_true",
+                       help="Entrena una Ridge por tienda en lugar de la global.")
+    multi.add_argument("--sin-rebalanceo", action="store_true",
+                       help="No propone traspasos entre tiendas.")
+    multi.add_argument("--formato", choices=list(FORMATOS_EXPORTACION), default="csv",
+                       help="Formato de las tablas de compra.")
+    multi.add_argument("--fecha", default=None, help="Fecha de planeación AAAA-MM-DD (por defecto, hoy).")
+    multi.add_argument("--modelo", default=None,
+                       help="Artefacto del modelo (carpeta) cuya Ridge se comparte sin reajustar.")
+
+    comparar = sub.add_parser("comparar", help="Compara el camino optimizado contra la referencia v9.2.1.")
+    comparar.add_argument("--historico", default=None, help="Histórico (xlsx/csv/parquet). Sin él, usa datos sintéticos.")
+    comparar.add_argument("--erply", default=None, help="Archivo Erply (requerido junto con --historico).")
+    comparar.add_argument("--skus", type=int, default=2000, help="SKUs del caso sintético.")
+    comparar.add_argument("--semilla", type=int, default=0, help="Semilla del caso sintético.")
+    comparar.add_argument("--fecha", default=None, help="Fecha de planeación AAAA-MM-DD (por defecto, hoy).")
+    comparar.add_argument("--repeticiones", type=int, default=1, help="Corridas por etapa (se toma la más rápida).")
+    comparar.add_argument("--reporte", default=None, help="Guarda el reporte en JSON.")
+
+    historico = sub.add_parser("historico", help="Administra el histórico local (deltas mensuales).")
+    historico.add_argument("--dir", default=os.path.join(DIR_CACHE, "historico"), help="Carpeta del histórico local.")
+    accion = historico.add_mutually_exclusive_group()
+    accion.add_argument("--agregar", default=None, help="Delta de un mes (xlsx/csv/parquet).")
+    accion.add_argument("--reemplazar", default=None, help="Histórico completo para la carga inicial.")
+
+    precalcular = sub.add_parser("precalcular", help="Precalcula el plan y lo publica en la caché local (para cron).")
+    fuente = precalcular.add_mutually_exclusive_group(required=True)
+    fuente.add_argument("--historico", default=None, help="Histórico (xlsx/csv/parquet).")
+    fuente.add_argument("--historico-local", nargs="?", const=os.path.join(DIR_CACHE, "historico"), default=None,
+                        help="Usa el histórico local (carpeta opcional).")
+    precalcular.add_argument("--erply", required=True, help="Archivo Erply más reciente.")
+    precalcular.add_argument("--fecha", default=None, help="Fecha de planeación AAAA-MM-DD (por defecto, hoy).")
+    precalcular.add_argument("--si-cambio", action="store_true",
+                             help="No recalcula si las entradas y el mes son los del último precálculo.")
+
+    modelo = sub.add_parser("modelo", help="Muestra el artefacto del modelo (por defecto, el del plan precalculado).")
+    modelo.add_argument("ruta", nargs="?", default=None, help="Carpeta del artefacto.")
+
+    arranque = sub.add_parser("arranque", help="Verifica el presupuesto de tiempo de importación del núcleo.")
+    arranque.add_argument("--presupuesto", type=float, default=PRESUPUESTO_IMPORTACION_S,
+                          help="Segundos máximos (pandas + numpy + compras).")
+    arranque.add_argument("--repeticiones", type=int, default=3, help="Procesos medidos (se toma el más rápido).")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "multi":
+        consolidado, traspasos, avisos = run_multi_store(
+            args.manifiesto, args.salida,
+            workers=args.workers, modelo_global=not args.modelo_por_tienda,
+            rebalanceo=not args.sin_rebalanceo, formato=args.formato, fecha_corte=args.fecha,
+            modelo=args.modelo,
+        )
+        for aviso in avisos:
+            print(f"AVISO: {aviso}")
+        print(
+            f"{consolidado['Tienda'].nunique()} tiendas, {len(consolidado)} SKUs a comprar, "
+            f"importe ${consolidado['Importe'].fillna(0).sum():,.2f}, "
+            f"{int(traspasos['Cantidad'].sum())} piezas en traspasos -> {args.salida}"
+        )
+
+    if args.comando == "comparar":
+        if args.historico:
+            if not args.erply:
+                parser.error("--historico requiere --erply")
+            hist, vs = prepare_hist(read_hist(args.historico)), read_erply(args.erply)
+        else:
+            hist, vs = synthetic_inputs(args.skus, args.semilla, fecha_corte=args.fecha)
+
+        reporte = run_comparison(vs, hist, fecha_corte=args.fecha, repeticiones=args.repeticiones)
+
+        print(f"Referencia v9.2.1 vs {reporte['version']} | {reporte['skus']} SKUs | mes {reporte['fecha_corte']}")
+        print(reporte["etapas"].to_string(index=False))
+        print("Memoria: pico de tracemalloc del proceso principal (la tabla optimizada con particiones=1).")
+        print()
+        print(reporte["columnas"].to_string(index=False))
+        print()
+        print("Feature store vs cálculo directo:")
+        print(reporte["feature_store"].to_string(index=False))
+        if reporte["solo_referencia"] or reporte["solo_optimizado"]:
+            print(
+                f"Filas solo en referencia: {len(reporte['solo_referencia'])}, "
+                f"solo en optimizado: {len(reporte['solo_optimizado'])}"
+            )
+        print("PASA" if reporte["paso"] else "FALLA")
+
+        if args.reporte:
+            write_atomic_json(args.reporte, {
+                **reporte,
+                "etapas": reporte["etapas"].to_dict("records"),
+                "columnas": reporte["columnas"].replace({np.nan: None}).to_dict("records"),
+                "feature_store": reporte["feature_store"].to_dict("records"),
+            })
+
+        return 0 if reporte["paso"] else 1
+
+    if args.comando == "precalcular":
+        historico = HistoryStore(args.historico_local) if args.historico_local else args.historico
+        manifest, calculado = run_precompute(
+            historico, args.erply, fecha_corte=args.fecha, solo_si_cambio=args.si_cambio
+        )
+        estado = "Plan precalculado" if calculado else "Sin cambios en las entradas ni en el mes; se conserva el plan"
+        print(
+            f"{estado} del {manifest['creado']} (mes {manifest['fecha_corte']}): "
+            f"{manifest['skus_compra']:,} SKUs a comprar, importe ${manifest['importe']:,.2f}"
+        )
+
+    if args.comando == "modelo":
+        ruta = args.ruta
+        if ruta is None:
+            manifest = read_precompute_manifest()
+            if manifest is None or not manifest.get("modelo"):
+                print("ERROR: no hay un plan precalculado con artefacto del modelo.")
+                return 1
+            ruta = precompute_model_path(manifest)
+
+        info = read_model_artifact_manifest(ruta)
+        print(f"{ruta}: formato {info['formato']}, versión {info['version']}, creado {info['creado']}")
+        print(f"Huella de entradas: {info['clave']}")
+        if info["fechas_24m"]:
+            print(f"Ventana de comportamiento: {info['fechas_24m'][0]} a {info['fechas_24m'][-1]}")
+        print(f"Ridge: {'alpha ' + str(info['ridge']['alpha']) if info['ridge'] else 'sin ajustar'}"
+              f" | GMM: {info['gmm']['n_components'] if info['gmm'] else 0} componentes")
+        for nombre, meta in info["arreglos"].items():
+            print(f"  {nombre:<26} {meta['dtype']:<8} {tuple(meta['shape'])}")
+        if info["version"] != APP_VERSION:
+            print(f"AVISO: el artefacto no es de la versión actual ({APP_VERSION}).")
+
+    if args.comando == "arranque":
+        medidas = [measure_core_import() for _ in range(max(1, args.repeticiones))]
+        mejor = min(medidas, key=lambda m: m["base"] + m["compras"])
+        total = mejor["base"] + mejor["compras"]
+        pesados = sorted({m for medida in medidas for m in medida["pesados"]})
+
+        print(f"pandas + numpy: {mejor['base']:.3f}s | compras: {mejor['compras']:.3f}s | total: {total:.3f}s "
+              f"(presupuesto {args.presupuesto:.2f}s)")
+        if pesados:
+            print(f"Módulos pesados cargados al importar: {', '.join(pesados)}")
+        paso = total <= args.presupuesto and not pesados
+        print("PASA" if paso else "FALLA")
+        return 0 if paso else 1
+
+    if args.comando == "historico":
+        historico_local = HistoryStore(args.dir)
+        if args.reemplazar:
+            resumen = historico_local.replace(read_hist(args.reemplazar))
+            print(f"Histórico reemplazado: {resumen['meses']} meses, {resumen['filas']:,} filas")
+        elif args.agregar:
+            try:
+                resumen = historico_local.append(read_hist(args.agregar))
+            except ValueError as e:
+                print(f"ERROR: {e}")
+                return 1
+            print(f"{resumen['mes']}: {resumen['nuevas']:,} filas nuevas, {resumen['duplicadas']:,} omitidas")
+
+        meses = historico_local.months()
+        print(f"{len(meses)} meses en {args.dir}" + (f" ({meses[0]} a {meses[-1]})" if meses else ""))
+
+    return 0
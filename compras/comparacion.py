@@ -0,0 +1,320 @@
+"""Comparación del camino optimizado contra la referencia v9.2.1."""
+import contextlib
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+from .config import (
+    APP_VERSION, TOLERANCIAS_POR_COLUMNA, TOLERANCIA_ABS_COMPARACION, TOLERANCIA_REL_COMPARACION,
+)
+from .helpers import current_month
+from .ingesta import prepare_hist
+from .features import (
+    build_cost, build_current_seasonality_for_purchase, build_monthly_features, build_school_demand,
+    build_seasonality, build_v05_v06, MonthlyFeatureStore,
+)
+from .modelo import predict_next_month_per_sku, train_global_regression
+from .segmentacion import build_gmm_segmentation
+from .politica import build_final_table
+
+
+# =========================
+# COMPARACION CONTRA REFERENCIA v9.2.1
+# =========================
+def synthetic_inputs(n_skus=2000, semilla=0, fecha_corte=None, meses=24):
+    """Histórico mensual y Erply sintéticos (mismo esquema que prepare_hist / read_erply)."""
+    rng = np.random.default_rng(semilla)
+    fin = pd.Timestamp(fecha_corte or pd.Timestamp.today()).to_period("M") - 1
+    periodos = pd.period_range(end=fin, periods=meses, freq="M")
+
+    codigos = np.array([f"SKU{i:06d}" for i in range(n_skus)])
+    base = rng.gamma(1.2, 6.0, n_skus)
+    precio = rng.uniform(5, 500, n_skus).round(2)
+    escolar = rng.random(n_skus) < 0.2
+    pico = np.isin(periodos.month, [7, 8])
+
+    tasa = base[:, None] * np.where(escolar[:, None] & pico[None, :], 2.5, 1.0)
+    ventas = rng.poisson(tasa).astype(float)
+    ventas[rng.random(ventas.shape) < 0.15] = np.nan  # meses sin registro
+
+    hist = pd.DataFrame({
+        "Código": np.repeat(codigos, meses),
+        "Año": np.tile(periodos.year, n_skus),
+        "Mes": np.tile(periodos.month, n_skus),
+        "Ventas": ventas.ravel(),
+        "Importe": (ventas * precio[:, None]).ravel(),
+    }).dropna(subset=["Ventas"])
+
+    vs = pd.DataFrame({
+        "Código": codigos,
+        "EAN": [str(7500000000000 + i) for i in range(n_skus)],
+        "Nombre": [f"Producto {i}" for i in range(n_skus)],
+        "V30D": rng.poisson(base).astype(float),
+        "Stock": rng.poisson(base * 0.8).astype(float),
+    })
+    return prepare_hist(hist), vs
+
+
+@contextlib.contextmanager
+def reference_month(referencia, fecha_corte):
+    """La referencia lee el mes de hoy; se fija al mes de planeación durante la comparación."""
+    original = referencia.current_month
+    referencia.current_month = lambda: current_month(fecha_corte)
+    try:
+        yield
+    finally:
+        referencia.current_month = original
+
+
+@contextlib.contextmanager
+def reference_without_gmm(referencia):
+    """Referencia sin el ajuste del GMM, para comparar solo la segmentación por reglas."""
+    original = referencia.USAR_SEGMENTACION_GMM
+    referencia.USAR_SEGMENTACION_GMM = False
+    try:
+        yield
+    finally:
+        referencia.USAR_SEGMENTACION_GMM = original
+
+
+def reference_rule_segmentation(referencia, hist):
+    with reference_without_gmm(referencia):
+        return referencia.build_gmm_segmentation(hist)
+
+
+def comparison_stages(referencia, vs, hist, fecha_corte):
+    """
+    (etapa, referencia, optimizado, optimizado para la pasada de memoria o None).
+    La última etapa es la tabla de compra completa.
+
+    La segmentación compara solo las reglas: la referencia ajusta un GMM fijo y el
+    optimizado elige el modelo por BIC (con caché), así que ni los tiempos ni los
+    clusters son comparables. La tabla optimizada mide su memoria con
+    particiones=1, porque tracemalloc solo ve el proceso principal.
+    """
+    def regresion(build_features, train_regression, predict):
+        monthly, train = build_features(hist)
+        model, feature_cols = train_regression(train)
+        return predict(monthly, model, feature_cols)
+
+    return [
+        ("costo", lambda: referencia.build_cost(hist), lambda: build_cost(hist), None),
+        ("demanda_historica", lambda: referencia.build_school_demand(hist), lambda: build_school_demand(hist), None),
+        ("ventas_mes", lambda: referencia.build_v05_v06(hist), lambda: build_v05_v06(hist), None),
+        (
+            "regresion",
+            lambda: regresion(
+                referencia.build_monthly_features, referencia.train_global_regression,
+                referencia.predict_next_month_per_sku,
+            ),
+            lambda: regresion(build_monthly_features, train_global_regression, predict_next_month_per_sku),
+            None,
+        ),
+        (
+            "estacionalidad",
+            lambda: referencia.build_current_seasonality_for_purchase(referencia.build_seasonality(hist)),
+            lambda: build_current_seasonality_for_purchase(build_seasonality(hist), fecha_corte=fecha_corte),
+            None,
+        ),
+        (
+            "segmentacion_reglas",
+            lambda: reference_rule_segmentation(referencia, hist),
+            lambda: build_gmm_segmentation(hist, ajustar_gmm=False),
+            None,
+        ),
+        (
+            "tabla_compra",
+            lambda: referencia.build_final_table(vs, hist)[0],
+            lambda: build_final_table(vs, hist, fecha_corte=fecha_corte)[0],
+            lambda: build_final_table(vs, hist, fecha_corte=fecha_corte, particiones=1)[0],
+        ),
+    ]
+
+
+def measure_stage(fn, repeticiones=1, fn_memoria=None):
+    """
+    Devuelve (resultado, mejor tiempo en s, pico de memoria en bytes). La memoria
+    se mide con tracemalloc (solo el proceso principal) sobre `fn_memoria`, o
+    sobre `fn` si no se da.
+    """
+    tiempos = []
+    for _ in range(max(1, repeticiones)):
+        inicio = time.perf_counter()
+        resultado = fn()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        (fn_memoria or fn)()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return resultado, min(tiempos), pico
+
+
+def compare_tables(ref, opt, rtol=TOLERANCIA_REL_COMPARACION, atol=TOLERANCIA_ABS_COMPARACION):
+    """
+    Diferencias columna por columna entre dos tablas de compra, alineadas por Código.
+    Devuelve (resumen por columna, filas solo en referencia, filas solo en optimizado).
+    """
+    def keyed(df):
+        clave = df["Código"].astype(str) + "#" + df.groupby("Código").cumcount().astype(str)
+        return df.set_index(clave)
+
+    ref, opt = keyed(ref), keyed(opt)
+    comunes = ref.index.intersection(opt.index)
+    solo_ref = ref.index.difference(opt.index)
+    solo_opt = opt.index.difference(ref.index)
+
+    filas = []
+    for col in ref.columns.union(opt.columns, sort=False):
+        if col not in opt.columns or col not in ref.columns:
+            filas.append({
+                "Columna": col, "Diferencias": len(comunes), "Max_Dif_Abs": np.nan,
+                "Estado": "FALTA_EN_OPTIMIZADO" if col in ref.columns else "SOLO_EN_OPTIMIZADO",
+            })
+            continue
+
+        a, b = ref.loc[comunes, col], opt.loc[comunes, col]
+        ambos_nulos = a.isna().to_numpy() & b.isna().to_numpy()
+
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            col_rtol, col_atol = TOLERANCIAS_POR_COLUMNA.get(col, (rtol, atol))
+            x, y = a.to_numpy(dtype=float), b.to_numpy(dtype=float)
+            iguales = np.isclose(x, y, rtol=col_rtol, atol=col_atol) | ambos_nulos
+            dif = np.abs(x - y)
+            max_dif = float(np.nanmax(dif)) if np.isfinite(dif).any() else 0.0
+        else:
+            iguales = (a.astype(str).to_numpy() == b.astype(str).to_numpy()) | ambos_nulos
+            max_dif = np.nan
+
+        n = int((~iguales).sum())
+        filas.append({"Columna": col, "Diferencias": n, "Max_Dif_Abs": max_dif, "Estado": "OK" if n == 0 else "DIFIERE"})
+
+    return pd.DataFrame(filas), list(solo_ref), list(solo_opt)
+
+
+def stage_differences(ref, opt):
+    """
+    Valores distintos entre las salidas de una etapa (tablas, series o tuplas de
+    ellas), más filas que solo están en una. Las columnas que solo tiene el
+    optimizado no cuentan, igual que en la tabla de compra.
+    """
+    if isinstance(ref, tuple):
+        return sum(stage_differences(a, b) for a, b in zip(ref, opt))
+    if isinstance(ref, pd.Series):
+        ref, opt = ref.reset_index(), opt.reset_index()
+    if isinstance(ref, pd.DataFrame):
+        columnas, solo_ref, solo_opt = compare_tables(ref, opt)
+        difieren = columnas["Estado"].isin(["DIFIERE", "FALTA_EN_OPTIMIZADO"])
+        return int(columnas.loc[difieren, "Diferencias"].sum()) + len(solo_ref) + len(solo_opt)
+    return int(ref != opt)
+
+
+def move_units_last_month(hist, unidades=2):
+    """Copia del histórico con `unidades` movidas entre los dos primeros SKUs del último mes."""
+    periodo = hist["Año"] * 12 + hist["Mes"]
+    ultimo = hist[periodo == periodo.max()]
+    donante = ultimo[ultimo["Ventas"] >= unidades].index[:1]
+    receptor = ultimo.index.difference(donante)[:1]
+    out = hist.copy()
+    out.loc[donante, "Ventas"] -= unidades
+    out.loc[receptor, "Ventas"] += unidades
+    return out
+
+
+def compare_feature_store(vs, hist, fecha_corte):
+    """
+    Tabla de compra con MonthlyFeatureStore contra la misma tabla sin él. Un
+    almacén temporal recibe el histórico sin su último mes, luego el histórico
+    completo (mes agregado), luego una corrección que mueve unidades entre dos
+    SKUs del último mes (mismo total) y luego la ventana corrida un mes (mes retirado).
+    Devuelve un DataFrame con una fila por caso; las tablas deben ser idénticas.
+    """
+    periodo = hist["Año"] * 12 + hist["Mes"]
+    casos = [
+        ("mes_agregado", hist),
+        ("correccion_mes", move_units_last_month(hist)),
+        ("ventana_movil", hist[periodo > periodo.min()]),
+    ]
+
+    filas = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        store = MonthlyFeatureStore(carpeta)
+        store.update(hist[periodo < periodo.max()])
+        for caso, h in casos:
+            con_store = build_final_table(vs, h, feature_store=store, fecha_corte=fecha_corte)[0]
+            sin_store = build_final_table(vs, h, fecha_corte=fecha_corte)[0]
+            columnas, solo_sin, solo_con = compare_tables(sin_store, con_store, rtol=0, atol=0)
+            difieren = columnas.loc[columnas["Estado"] != "OK", "Columna"].tolist()
+            filas.append({
+                "Caso": caso,
+                "Meses": int(periodo.loc[h.index].nunique()),
+                "Columnas_Difieren": ", ".join(difieren),
+                "Filas_Solo_Una_Tabla": len(solo_sin) + len(solo_con),
+                "Estado": "OK" if not difieren and not solo_sin and not solo_con else "DIFIERE",
+            })
+
+    return pd.DataFrame(filas)
+
+
+def run_comparison(vs, hist, fecha_corte=None, repeticiones=1):
+    """
+    Corre la referencia v9.2.1 y el camino optimizado con las mismas entradas.
+    Devuelve un dict con la aceleración, la razón de memoria y las diferencias por
+    etapa, el diff de la tabla de compra y `paso` (True si todas las etapas y la
+    tabla coinciden dentro de tolerancias). La memoria es la del proceso principal
+    (ver comparison_stages).
+    La columna SOLO_EN_OPTIMIZADO (p. ej. Stock_Seguridad) no hace fallar la comparación.
+    También exige que el feature store dé la misma tabla que el cálculo directo
+    (ver compare_feature_store).
+    """
+    from . import referencia
+
+    fecha_corte = pd.Timestamp(fecha_corte or pd.Timestamp.today())
+    etapas = []
+    tablas = {}
+
+    with reference_month(referencia, fecha_corte):
+        for nombre, fn_ref, fn_opt, fn_opt_memoria in comparison_stages(referencia, vs, hist, fecha_corte):
+            out_ref, t_ref, m_ref = measure_stage(fn_ref, repeticiones)
+            out_opt, t_opt, m_opt = measure_stage(fn_opt, repeticiones, fn_opt_memoria)
+            tablas[nombre] = (out_ref, out_opt)
+            diferencias = stage_differences(out_ref, out_opt)
+            etapas.append({
+                "Etapa": nombre,
+                "Ref_s": round(t_ref, 4),
+                "Opt_s": round(t_opt, 4),
+                "Aceleracion": round(t_ref / max(t_opt, 1e-9), 2),
+                "Ref_MB": round(m_ref / 2**20, 1),
+                "Opt_MB": round(m_opt / 2**20, 1),
+                "Razon_Memoria": round(m_ref / max(m_opt, 1), 2),
+                "Diferencias": diferencias,
+                "Estado": "OK" if diferencias == 0 else "DIFIERE",
+            })
+
+    columnas, solo_ref, solo_opt = compare_tables(*tablas["tabla_compra"])
+    feature_store = compare_feature_store(vs, hist, fecha_corte)
+    etapas = pd.DataFrame(etapas)
+    paso = (
+        (etapas["Estado"] == "OK").all()
+        and not solo_ref and not solo_opt
+        and columnas["Estado"].isin(["OK", "SOLO_EN_OPTIMIZADO"]).all()
+        and (feature_store["Estado"] == "OK").all()
+    )
+
+    return {
+        "version": APP_VERSION,
+        "fecha_corte": f"{fecha_corte:%Y-%m-%d}",
+        "skus": int(hist["Código"].nunique()),
+        "etapas": etapas,
+        "columnas": columnas,
+        "feature_store": feature_store,
+        "solo_referencia": solo_ref,
+        "solo_optimizado": solo_opt,
+        "paso": bool(paso),
+    }
@@ -0,0 +1,216 @@
+"""Parámetros del agente de compras."""
+import os
+
+APP_VERSION = "v9.2.1 RIDGE + GMM SEGMENTACION (ajustado)"
+
+MIN_ROTACION_V30D = 3
+COMPRA_MINIMA_UNIDAD = 1
+UMBRAL_COMPRA_DEMANDA = 0.25
+
+# Mezcla base
+PESO_REGRESION = 0.70
+PESO_V30D = 0.30
+
+# Seguridad de regresión
+MIN_MESES_PARA_REGRESION = 3
+MAX_FACTOR_SOBRE_HISTORICO = 2.5
+MAX_FACTOR_SOBRE_V30D = 3.0
+
+# Ridge
+RIDGE_ALPHA = 3.0
+MIN_FILAS_ENTRENAMIENTO = 30
+
+# Incertidumbre de la demanda (residuales de la Ridge por segmento)
+NIVEL_SERVICIO = 0.95
+CUANTILES_DEMANDA = [0.50, 0.80, 0.95]
+MIN_RESIDUALES_SEGMENTO = 30  # con menos residuales el segmento usa la distribución global
+USAR_STOCK_SEGURIDAD = False  # si True, el stock de seguridad se suma al objetivo de compra
+
+# Estacionalidad
+USAR_ESTACIONALIDAD = True
+ANOS_ESTACIONALIDAD = [2024, 2025]
+PESO_ANO_ESTACIONALIDAD = {
+    2024: 0.4,
+    2025: 0.6,
+}
+FACTOR_ESTACIONAL_MIN = 0.5
+FACTOR_ESTACIONAL_MAX = 2.5
+
+# Demanda histórica de apoyo por temporada: ventana de meses, años comparados,
+# cortes del ratio actual/anterior y pesos (actual, anterior) por Tipo.
+TEMPORADA_DEMANDA = "escolar"
+TEMPORADAS = {
+    "escolar": {
+        "meses": [4, 5, 6, 7, 8, 9, 10],
+        "ano_actual": 2025,
+        "ano_anterior": 2024,
+        "cortes_ratio": (0.7, 1.1),  # < 0.7 SOBRECOMPRA, <= 1.1 ALINEADO, resto SUBESTIMADO
+        "pesos": {
+            "SOBRECOMPRA": (0.9, 0.1),
+            "ALINEADO": (0.75, 0.25),
+            "SUBESTIMADO": (0.6, 0.4),
+        },
+    },
+}
+
+# Limpieza del histórico (picos de promoción y meses de quiebre de stock)
+USAR_LIMPIEZA_HISTORIA = False  # si True, features, Ridge, temporada y segmentación usan la serie limpia
+VENTANA_LIMPIEZA_MESES = 6  # meses calendario que terminan en el mes evaluado
+MIN_MESES_LIMPIEZA = 4  # meses con registro mínimos en la ventana para tocar el valor
+LIMPIEZA_K_MAD = 3.5  # tope de un pico = mediana + k * escala robusta (1.4826 * MAD)
+LIMPIEZA_ESCALA_MIN = 0.25  # escala robusta mínima, como fracción de la mediana
+MIN_NIVEL_QUIEBRE = 3.0  # mediana mínima (piezas/mes) para tratar un mes en 0 como quiebre
+
+# Ventana de compra
+MESES_ANTICIPACION = 1
+PESO_MES_ACTUAL = 0.70
+PESO_MES_SIGUIENTE = 0.30
+
+# Nivel de cobertura (Stock / Demanda30, en meses)
+COBERTURA_NIVEL_CRITICO = 0.3
+COBERTURA_NIVEL_MEDIO = 0.8
+
+# Rebalanceo entre tiendas (traspasos antes de comprar)
+USAR_REBALANCEO = True
+COBERTURA_EXCEDENTE = 2.0  # a partir de estos meses de cobertura una tienda puede ceder
+COBERTURA_RETENER_DONANTE = 1.5  # meses de demanda que conserva la tienda que cede
+
+# Explorador de resultados (solo la página visible se envía al navegador)
+FILAS_POR_PAGINA = [50, 100, 250, 500]
+NIVELES_COBERTURA = ["CRITICO", "MEDIO", "SANO"]
+
+# Exportación
+EXPORT_FILAS_POR_BLOQUE = 50_000
+FORMATOS_EXPORTACION = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Shards por SKU (etapas por SKU en paralelo)
+PARTICIONES_SKU = None  # None = automático: un shard por núcleo a partir de MIN_SKUS_PARTICIONAR
+MIN_SKUS_PARTICIONAR = 20_000
+
+# Arranque de los procesos de los pools (shards, GMM, multi-tienda). Con "fork" desde
+# un hilo de Streamlit el hijo puede heredar locks tomados por otros hilos y colgarse.
+METODO_PROCESOS = "forkserver"  # donde no existe (Windows) se usa "spawn"
+
+# Arranque: tiempo máximo para importar el núcleo (pandas + numpy + compras) en un
+# proceso nuevo, y módulos que solo deben cargarse cuando se usan
+PRESUPUESTO_IMPORTACION_S = 1.0
+MODULOS_PESADOS = ("streamlit", "sklearn", "scipy", "openpyxl", "lxml")
+
+# Comparación contra la implementación de referencia v9.2.1 (referencia.py)
+TOLERANCIA_REL_COMPARACION = 1e-9
+TOLERANCIA_ABS_COMPARACION = 1e-6
+TOLERANCIAS_POR_COLUMNA = {"Compra": (0.0, 0.0)}  # (rel, abs); la cantidad a comprar debe ser exacta
+
+# Caché local (feature store, histórico local, resultados precalculados). Se ancla a
+# la carpeta del proyecto y no al directorio de trabajo: el precálculo programado
+# (cron arranca en $HOME) y la UI deben ver la misma caché. COMPRAS_CACHE la cambia.
+DIR_CACHE = os.environ.get("COMPRAS_CACHE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"
+)
+USAR_FEATURE_STORE = True
+
+# Segmentación GMM
+USAR_SEGMENTACION_GMM = True
+GMM_COMPONENTES = 6
+GMM_RANDOM_STATE = 42
+GMM_MIN_SKUS = 50
+GMM_CONFIANZA_MINIMA = 0.80  # usado para marcar "Revisar_GMM" en la tabla final
+
+# Selección del GMM por BIC (candidatos y reinicios en paralelo)
+GMM_SELECCION_BIC = True
+GMM_RANGO_COMPONENTES = range(2, 13)
+GMM_TIPOS_COVARIANZA = ("full", "diag")  # en orden de prioridad si el presupuesto no alcanza
+# Costo relativo de un reinicio por componente (medido); el presupuesto por núcleo es
+# el del GMM fijo: GMM_N_INIT reinicios de GMM_COMPONENTES componentes "full".
+GMM_COSTO_COVARIANZA = {"full": 1.0, "diag": 0.3}
+GMM_N_INIT = 5
+GMM_WORKERS = None  # None = todos los núcleos
+GMM_DESPLAZAMIENTO_MAX = 0.25  # desplazamiento (en desviaciones) que obliga a reajustar el GMM en caché
+
+# Ingesta de transacciones (ventas diarias o por ticket en CSV / Parquet)
+FILAS_POR_BLOQUE = 500_000
+BLOQUES_POR_CONSOLIDACION = 8  # cada cuántos bloques se compactan los parciales
+COLUMNAS_TRANSACCION = {
+    "Código": ["Código", "Codigo", "CODIGO", "SKU", "Clave"],
+    "Fecha": ["Fecha", "FECHA", "Fecha_Venta", "Dia", "Día"],
+    "Año": ["Año", "Ano", "AÑO"],
+    "Mes": ["Mes", "MES"],
+    "Ventas": ["Ventas", "Cantidad", "Unidades", "Piezas"],
+    "Importe": ["Importe", "Total", "Monto"],
+}
+
+# Meses mínimos con venta para confiar en el índice estacional
+# (con menos meses, el índice max/promedio se dispara por azar y genera falsos "ESTACIONAL")
+MIN_MESES_PARA_ESTACIONAL = 8
+
+# Parámetros dinámicos por perfil
+PARAMETROS_PERFIL = {
+    "ALTA_ROTACION_ESTABLE": {
+        "peso_regresion": 0.85,
+        "peso_v30d": 0.15,
+        "max_hist": 2.5,
+        "max_v30d": 3.0,
+        "umbral": 0.15,
+        "politica": "Cobertura alta y reposición frecuente. Confiar más en la regresión.",
+    },
+    "DEMANDA_EN_CRECIMIENTO": {
+        "peso_regresion": 0.65,
+        "peso_v30d": 0.35,
+        "max_hist": 3.5,
+        "max_v30d": 4.0,
+        "umbral": 0.20,
+        "politica": "Subir cobertura gradualmente. Permitir crecimiento sin disparar compras excesivas.",
+    },
+    "DEMANDA_EN_DESCENSO": {
+        "peso_regresion": 0.45,
+        "peso_v30d": 0.55,
+        "max_hist": 1.8,
+        "max_v30d": 2.0,
+        "umbral": 0.35,
+        "politica": "Comprar conservador. Evitar sobreinventario.",
+    },
+    "BAJA_ROTACION_ESPORADICA": {
+        "peso_regresion": 0.15,
+        "peso_v30d": 0.85,
+        "max_hist": 1.2,
+        "max_v30d": 1.5,
+        "umbral": 0.50,
+        "politica": "Comprar solo si el faltante es claro. Preferir mínimo indispensable.",
+    },
+    "ESTACIONAL": {
+        "peso_regresion": 0.55,
+        "peso_v30d": 0.45,
+        "max_hist": 3.0,
+        "max_v30d": 3.5,
+        "umbral": 0.25,
+        "politica": "Respetar estacionalidad. Aumentar antes de temporada y reducir después.",
+    },
+    "ERRATICO_VARIABLE": {
+        "peso_regresion": 0.35,
+        "peso_v30d": 0.65,
+        "max_hist": 2.0,
+        "max_v30d": 2.2,
+        "umbral": 0.40,
+        "politica": "Comprar con cautela. Priorizar venta reciente sobre pronóstico largo.",
+    },
+    "SIN_HISTORICO": {
+        "peso_regresion": 0.20,
+        "peso_v30d": 0.80,
+        "max_hist": 1.0,
+        "max_v30d": 1.5,
+        "umbral": 0.50,
+        "politica": "Sin historial suficiente. Comprar solo por rotación reciente o necesidad clara.",
+    },
+    "GLOBAL": {
+        "peso_regresion": PESO_REGRESION,
+        "peso_v30d": PESO_V30D,
+        "max_hist": MAX_FACTOR_SOBRE_HISTORICO,
+        "max_v30d": MAX_FACTOR_SOBRE_V30D,
+        "umbral": UMBRAL_COMPRA_DEMANDA,
+        "politica": "Parámetros globales por confianza baja o perfil no determinado.",
+    },
+}
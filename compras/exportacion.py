@@ -0,0 +1,93 @@
+"""Exportación de la tabla de compra (CSV, XLSX, Parquet)."""
+import hashlib
+import io
+import os
+
+import pandas as pd
+
+from .config import APP_VERSION, EXPORT_FILAS_POR_BLOQUE
+
+
+# =========================
+# EXPORTACION
+# =========================
+def clean_ean(ean):
+    return ean.fillna("").astype(str).str.replace(r"\.0$", "", regex=True)
+
+
+def format_ean_for_excel(ean):
+    """EAN como fórmula ="..." para que Excel no lo convierta a número al abrir el CSV."""
+    ean = clean_ean(ean)
+    return ('="' + ean + '"').where(ean != "", "")
+
+
+def iter_csv_chunks(tabla, filas=EXPORT_FILAS_POR_BLOQUE):
+    """CSV (utf-8 con BOM) en bloques de bytes, sin copiar la tabla completa."""
+    for inicio in range(0, max(len(tabla), 1), filas):
+        bloque = tabla.iloc[inicio:inicio + filas].copy()
+        bloque["EAN"] = format_ean_for_excel(bloque["EAN"])
+        texto = bloque.to_csv(index=False, header=inicio == 0)
+        yield (("\ufeff" + texto) if inicio == 0 else texto).encode("utf-8")
+
+
+def write_xlsx(tabla, destino):
+    out = tabla.copy()
+    out["EAN"] = clean_ean(out["EAN"])
+
+    with pd.ExcelWriter(destino, engine="openpyxl") as writer:
+        out.to_excel(writer, index=False, sheet_name="Compra")
+        ws = writer.sheets["Compra"]
+        col = out.columns.get_loc("EAN") + 1
+        for (cell,) in ws.iter_rows(min_row=2, min_col=col, max_col=col):
+            cell.number_format = "@"
+
+
+def write_parquet(tabla, destino):
+    out = tabla.copy()
+    out["EAN"] = clean_ean(out["EAN"])
+    out.to_parquet(destino, index=False)
+
+
+def write_purchase_table(tabla, path):
+    """Escribe la tabla según la extensión (.csv, .xlsx o .parquet); el CSV va por bloques."""
+    formato = os.path.splitext(str(path))[1].lower().lstrip(".")
+    if formato == "xlsx":
+        write_xlsx(tabla, path)
+    elif formato == "parquet":
+        write_parquet(tabla, path)
+    else:
+        with open(path, "wb") as fh:
+            for chunk in iter_csv_chunks(tabla):
+                fh.write(chunk)
+
+
+def export_purchase_table(tabla, formato):
+    """Bytes del archivo de descarga en el formato pedido (csv, xlsx o parquet)."""
+    if formato == "csv":
+        return b"".join(iter_csv_chunks(tabla))
+
+    buffer = io.BytesIO()
+    if formato == "xlsx":
+        write_xlsx(tabla, buffer)
+    elif formato == "parquet":
+        write_parquet(tabla, buffer)
+    else:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    return buffer.getvalue()
+
+
+def input_fingerprint(*files):
+    """Huella de los archivos de entrada (contenido + versión) para cachear resultados."""
+    h = hashlib.sha1(APP_VERSION.encode("utf-8"))
+    for f in files:
+        if hasattr(f, "read"):
+            # Subida en memoria: se lee por bloques en lugar de copiarla con getvalue().
+            f.seek(0)
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+            f.seek(0)
+        else:
+            with open(f, "rb") as fh:
+                for bloque in iter(lambda: fh.read(1 << 20), b""):
+                    h.update(bloque)
+    return h.hexdigest()
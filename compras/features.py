@@ -0,0 +1,447 @@
+"""Features por SKU: mensuales (lags), costo, demanda de temporada, ventas por mes y estacionalidad."""
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from .config import (
+    ANOS_ESTACIONALIDAD, FACTOR_ESTACIONAL_MAX, FACTOR_ESTACIONAL_MIN, MESES_ANTICIPACION,
+    PESO_ANO_ESTACIONALIDAD, PESO_MES_ACTUAL, PESO_MES_SIGUIENTE, TEMPORADAS, TEMPORADA_DEMANDA,
+)
+from .helpers import (
+    current_month, month_key, month_signatures, safe_div, write_atomic_json, write_atomic_parquet,
+)
+
+
+# =========================
+# FEATURES MENSUALES MEJORADAS
+# =========================
+def aggregate_monthly(hist):
+    monthly = (
+        hist.groupby(["Código", "Año", "Mes"], as_index=False)
+        .agg({"Ventas": "sum", "Importe": "sum"})
+        .sort_values(["Código", "Año", "Mes"])
+        .reset_index(drop=True)
+    )
+
+    monthly["Fecha"] = pd.to_datetime(pd.DataFrame({"year": monthly["Año"], "month": monthly["Mes"], "day": 1}))
+
+    return monthly.sort_values(["Código", "Fecha"]).reset_index(drop=True)
+
+
+def add_lag_features(monthly):
+    g = monthly.groupby("Código")["Ventas"]
+
+    monthly["lag1"] = g.shift(1)
+    monthly["lag2"] = g.shift(2)
+    monthly["lag3"] = g.shift(3)
+    monthly["lag6"] = g.shift(6)
+    monthly["lag12"] = g.shift(12)
+
+    return add_window_features(monthly, monthly.groupby("Código").cumcount() + 1)
+
+
+def add_window_features(monthly, trend_idx):
+    """Features derivadas de los lags de cada fila (no miran otras filas)."""
+    monthly["ma3"] = monthly[["lag1", "lag2", "lag3"]].mean(axis=1)
+    monthly["std3"] = monthly[["lag1", "lag2", "lag3"]].std(axis=1)
+    monthly["max3"] = monthly[["lag1", "lag2", "lag3"]].max(axis=1)
+    monthly["min3"] = monthly[["lag1", "lag2", "lag3"]].min(axis=1)
+
+    monthly["diff1"] = monthly["lag1"] - monthly["lag2"]
+    monthly["diff2"] = monthly["lag2"] - monthly["lag3"]
+
+    monthly["ratio1"] = safe_div(monthly["lag1"], monthly["lag2"] + 1)
+    monthly["ratio2"] = safe_div(monthly["lag2"], monthly["lag3"] + 1)
+
+    monthly["trend_idx"] = trend_idx
+
+    monthly["Mes_sin"] = np.sin(2 * np.pi * monthly["Mes"] / 12)
+    monthly["Mes_cos"] = np.cos(2 * np.pi * monthly["Mes"] / 12)
+
+    return monthly
+
+
+def split_training_rows(monthly):
+    train = monthly.dropna(subset=["lag1", "lag2", "lag3"]).copy()
+
+    numeric_cols = [
+        "lag1", "lag2", "lag3", "lag6", "lag12",
+        "ma3", "std3", "max3", "min3",
+        "diff1", "diff2", "ratio1", "ratio2",
+        "trend_idx", "Mes_sin", "Mes_cos", "Ventas"
+    ]
+    for c in numeric_cols:
+        if c in train.columns:
+            train[c] = pd.to_numeric(train[c], errors="coerce")
+
+    flotantes = train.select_dtypes(include="float").columns
+    valores = train[flotantes].to_numpy()
+    if np.isinf(valores).any():
+        train[flotantes] = np.where(np.isinf(valores), np.nan, valores)
+
+    return train
+
+
+def build_monthly_features(hist):
+    monthly = add_lag_features(aggregate_monthly(hist))
+    return monthly, split_training_rows(monthly)
+
+
+# =========================
+# FEATURE STORE MENSUAL EN DISCO
+# =========================
+class MonthlyFeatureStore:
+    """
+    Features mensuales por (Código, mes) guardadas en disco, un Parquet por mes.
+    `colas.parquet` conserva las últimas MAX_LAG filas de cada SKU: con eso basta
+    para calcular los lags de un mes nuevo sin recorrer todo el histórico.
+    Se reconstruye si un mes ya guardado cambia, si llega un mes anterior al
+    último o si el histórico ya no trae un mes guardado (p. ej. un "Histórico 24M"
+    que avanzó un mes): las features siempre salen solo de los meses del histórico.
+    Las firmas por mes se calculan sobre el histórico sin agregar (month_signatures).
+    """
+
+    MAX_LAG = 12
+    VERSION = 3
+
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, "meta.json")
+        self.colas_path = os.path.join(path, "colas.parquet")
+
+    # ---- disco ----
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {"version": self.VERSION, "meses": {}}
+        with open(self.meta_path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != self.VERSION:
+            return {"version": self.VERSION, "meses": {}}
+        return meta
+
+    def write_meta(self, meta):
+        write_atomic_json(self.meta_path, meta)
+
+    def month_path(self, mes):
+        return os.path.join(self.path, f"mes={mes}.parquet")
+
+    def write_months(self, monthly, meta, firmas):
+        for fecha, g in monthly.groupby("Fecha", sort=True):
+            mes = month_key(fecha)
+            write_atomic_parquet(g, self.month_path(mes))
+            meta["meses"][mes] = firmas[mes]
+
+    def clear(self):
+        for mes in self.read_meta()["meses"]:
+            if os.path.exists(self.month_path(mes)):
+                os.remove(self.month_path(mes))
+
+    # ---- API ----
+    def load(self, codigos=None):
+        meses = sorted(self.read_meta()["meses"])
+        if not meses:
+            return build_monthly_features(
+                pd.DataFrame(columns=["Código", "Año", "Mes", "Ventas", "Importe"])
+            )
+
+        filtros = None if codigos is None else [("Código", "in", list(codigos))]
+        monthly = pd.concat(
+            [pd.read_parquet(self.month_path(m), filters=filtros) for m in meses],
+            ignore_index=True
+        )
+        monthly = monthly.sort_values(["Código", "Fecha"]).reset_index(drop=True)
+        return monthly, split_training_rows(monthly)
+
+    def update(self, hist):
+        """Agrega al almacén los meses nuevos de `hist` y devuelve (monthly, train)."""
+        os.makedirs(self.path, exist_ok=True)
+        meta = self.read_meta()
+
+        firmas = month_signatures(hist)
+        guardados = meta["meses"]
+        ultimo = max(guardados) if guardados else None
+
+        cambiados = [m for m in firmas if m in guardados and firmas[m] != guardados[m]]
+        atrasados = [m for m in firmas if m not in guardados and ultimo is not None and m < ultimo]
+        retirados = [m for m in guardados if m not in firmas]
+
+        if not guardados or cambiados or atrasados or retirados:
+            monthly = self.rebuild(aggregate_monthly(hist), firmas)
+            return monthly, split_training_rows(monthly)
+
+        meses_nuevos = [int(m.replace("-", "")) for m in firmas if m not in guardados]
+        if meses_nuevos:
+            periodo = hist["Año"].to_numpy() * 100 + hist["Mes"].to_numpy()
+            self.append(aggregate_monthly(hist[np.isin(periodo, meses_nuevos)]), meta, firmas)
+
+        return self.load()
+
+    def rebuild(self, monthly, firmas):
+        self.clear()
+        meta = {"version": self.VERSION, "meses": {}}
+        monthly = add_lag_features(monthly.copy())
+        self.write_months(monthly, meta, firmas)
+        write_atomic_parquet(self.tails(monthly), self.colas_path)
+        self.write_meta(meta)
+        return monthly
+
+    def append(self, nuevos, meta, firmas):
+        """
+        Lags de los meses nuevos a partir de las colas; las features derivadas
+        solo se calculan para las filas nuevas.
+        """
+        colas = pd.read_parquet(self.colas_path)
+        offset = (colas.groupby("Código")["trend_idx"].min() - 1).rename("Offset")
+
+        base = pd.concat(
+            [colas[["Código", "Año", "Mes", "Ventas", "Importe", "Fecha"]].assign(_nuevo=False),
+             nuevos.assign(_nuevo=True)],
+            ignore_index=True
+        ).sort_values(["Código", "Fecha"]).reset_index(drop=True)
+
+        g = base.groupby("Código")
+        trend_idx = g.cumcount() + 1 + base["Código"].map(offset).fillna(0).astype(int)
+        for k in [1, 2, 3, 6, 12]:
+            base[f"lag{k}"] = g["Ventas"].shift(k)
+
+        es_nueva = base.pop("_nuevo").to_numpy()
+        nuevas_filas = add_window_features(base[es_nueva].copy(), trend_idx[es_nueva])
+        self.write_months(nuevas_filas, meta, firmas)
+
+        write_atomic_parquet(self.tails(base.assign(trend_idx=trend_idx)), self.colas_path)
+        self.write_meta(meta)
+
+    def tails(self, monthly):
+        """Últimas MAX_LAG filas por SKU, con lo que append necesita de cada una."""
+        return (
+            monthly[["Código", "Año", "Mes", "Ventas", "Importe", "Fecha", "trend_idx"]]
+            .groupby("Código", sort=False).tail(self.MAX_LAG).reset_index(drop=True)
+        )
+
+
+# =========================
+# COSTO
+# =========================
+def build_cost(hist):
+    cost_2025 = (
+        hist[hist["Año"] == 2025]
+        .groupby("Código")
+        .agg({"Ventas": "sum", "Importe": "sum"})
+        .reset_index()
+    )
+    cost_2025["Costo_2025"] = np.where(
+        cost_2025["Ventas"] > 0,
+        cost_2025["Importe"] / cost_2025["Ventas"],
+        np.nan
+    )
+
+    cost_all = (
+        hist.groupby("Código")
+        .agg({"Ventas": "sum", "Importe": "sum"})
+        .reset_index()
+    )
+    cost_all["Costo_All"] = np.where(
+        cost_all["Ventas"] > 0,
+        cost_all["Importe"] / cost_all["Ventas"],
+        np.nan
+    )
+
+    cost = cost_2025[["Código", "Costo_2025"]].merge(
+        cost_all[["Código", "Costo_All"]],
+        on="Código",
+        how="outer"
+    )
+
+    cost["Costo"] = cost["Costo_2025"].fillna(cost["Costo_All"])
+    return cost[["Código", "Costo"]]
+
+
+# =========================
+# DEMANDA HISTORICA APOYO
+# =========================
+def build_school_demand(hist, temporada=None):
+    """
+    Demanda de la temporada (por defecto la escolar, abril-octubre) del año actual
+    contra el anterior: un solo pivote Código x Año y reglas de Tipo / pesos como
+    operaciones sobre arreglos. Ver TEMPORADAS.
+    """
+    cfg = TEMPORADAS[temporada or TEMPORADA_DEMANDA]
+    actual, anterior = cfg["ano_actual"], cfg["ano_anterior"]
+    col_actual, col_anterior = f"Dem_{actual}", f"Dem_{anterior}"
+
+    ventana = hist[hist["Mes"].isin(cfg["meses"]) & hist["Año"].isin([actual, anterior])]
+    pivote = (
+        ventana.groupby(["Código", "Año"])["Ventas"].sum()
+        .unstack("Año", fill_value=0)
+        .reindex(columns=[actual, anterior], fill_value=0)
+    )
+
+    dem_actual = pivote[actual].to_numpy(dtype=float)
+    dem_anterior = pivote[anterior].to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(
+            dem_anterior > 0,
+            dem_actual / dem_anterior,
+            np.where(dem_actual > 0, 9.99, 1)
+        )
+
+    corte_bajo, corte_alto = cfg["cortes_ratio"]
+    condiciones = [ratio < corte_bajo, ratio <= corte_alto]
+    tipos = ["SOBRECOMPRA", "ALINEADO", "SUBESTIMADO"]
+    pesos = np.array([cfg["pesos"][t] for t in tipos])
+
+    tipo = np.select(condiciones, tipos[:2], tipos[2])
+    indice = np.select(condiciones, [0, 1], 2)
+    demanda_base = pesos[indice, 0] * dem_actual + pesos[indice, 1] * dem_anterior
+
+    return pd.DataFrame({
+        "Código": pivote.index.to_numpy(),
+        col_actual: pivote[actual].to_numpy(),
+        col_anterior: pivote[anterior].to_numpy(),
+        "Ratio": ratio,
+        "Tipo": tipo,
+        "Demanda_Base": demanda_base,
+        "Demanda_Mensual_Historica": demanda_base / len(cfg["meses"]),
+    })
+
+
+# =========================
+# COLUMNAS MAYO / JUNIO 2025
+# =========================
+def build_v05_v06(hist):
+    v07 = (
+        hist[(hist["Año"] == 2025) & (hist["Mes"] == 7)]
+        .groupby("Código")["Ventas"]
+        .sum()
+        .rename("V07_2025")
+    )
+
+    v08 = (
+        hist[(hist["Año"] == 2025) & (hist["Mes"] == 8)]
+        .groupby("Código")["Ventas"]
+        .sum()
+        .rename("V08_2025")
+    )
+
+    v09 = (
+        hist[(hist["Año"] == 2025) & (hist["Mes"] == 9)]
+        .groupby("Código")["Ventas"]
+        .sum()
+        .rename("V09_2025")
+    )
+
+    return v07, v08, v09
+
+
+# =========================
+# FALLBACK GLOBAL DE COSTO
+# =========================
+def global_average_cost(hist):
+    total_ventas = hist["Ventas"].sum()
+    total_importe = hist["Importe"].sum()
+    return (total_importe / total_ventas) if total_ventas > 0 else 0
+
+
+def fill_missing_costs_with_global_average(final, hist, global_cost=None):
+    if global_cost is None:
+        global_cost = global_average_cost(hist)
+
+    final["Costo"] = final["Costo"].fillna(global_cost).fillna(0)
+    return final
+
+
+# =========================
+# ESTACIONALIDAD AUTOMATICA POR SKU
+# =========================
+def build_seasonality(hist):
+    hist_seas = hist[hist["Año"].isin(ANOS_ESTACIONALIDAD)].copy()
+
+    if hist_seas.empty:
+        return pd.DataFrame(columns=["Código", "Mes", "Factor_Estacional"])
+
+    hist_seas["Peso_Ano"] = hist_seas["Año"].map(PESO_ANO_ESTACIONALIDAD).fillna(1.0)
+    hist_seas["Ventas_Ponderadas"] = hist_seas["Ventas"] * hist_seas["Peso_Ano"]
+
+    by_month = (
+        hist_seas.groupby(["Código", "Mes"], as_index=False)["Ventas_Ponderadas"]
+        .sum()
+        .rename(columns={"Ventas_Ponderadas": "Ventas_Mes_Pond"})
+    )
+
+    skus = pd.DataFrame({"Código": hist_seas["Código"].unique()})
+    meses = pd.DataFrame({"Mes": np.arange(1, 13)})
+    base = skus.assign(key=1).merge(meses.assign(key=1), on="key").drop(columns="key")
+
+    seas = base.merge(by_month, on=["Código", "Mes"], how="left")
+    seas["Ventas_Mes_Pond"] = seas["Ventas_Mes_Pond"].fillna(0)
+
+    total_sku = (
+        seas.groupby("Código", as_index=False)["Ventas_Mes_Pond"]
+        .sum()
+        .rename(columns={"Ventas_Mes_Pond": "Ventas_Total_Pond"})
+    )
+
+    seas = seas.merge(total_sku, on="Código", how="left")
+
+    seas["Factor_Estacional"] = np.where(
+        seas["Ventas_Total_Pond"] > 0,
+        (seas["Ventas_Mes_Pond"] * 12.0) / seas["Ventas_Total_Pond"],
+        1.0
+    )
+
+    seas["Factor_Estacional"] = seas["Factor_Estacional"].clip(
+        lower=FACTOR_ESTACIONAL_MIN,
+        upper=FACTOR_ESTACIONAL_MAX
+    )
+
+    return seas[["Código", "Mes", "Factor_Estacional"]]
+
+
+def build_purchase_seasonality_matrix(seasonality_df):
+    """
+    Factor estacional de compra por SKU para los 12 meses de arranque posibles
+    (DataFrame Código x 1..12). La columna m mezcla el mes m y el siguiente con
+    PESO_MES_ACTUAL / PESO_MES_SIGUIENTE. Se calcula una vez; cambiar el mes de
+    planeación es solo escoger una columna.
+    """
+    meses = list(range(1, 13))
+    if seasonality_df.empty:
+        return pd.DataFrame(columns=meses, dtype=float)
+
+    f = (
+        seasonality_df.pivot(index="Código", columns="Mes", values="Factor_Estacional")
+        .reindex(columns=meses)
+        .fillna(1.0)
+    )
+
+    if MESES_ANTICIPACION == 0:
+        return f
+
+    actual = f.to_numpy()
+    siguiente = np.roll(actual, -1, axis=1)
+    return pd.DataFrame(
+        PESO_MES_ACTUAL * actual + PESO_MES_SIGUIENTE * siguiente,
+        index=f.index,
+        columns=meses,
+    )
+
+
+def seasonality_for_months(matrix, codigos, meses):
+    """Factores de compra de `codigos` para cada mes de `meses` (una columna por mes)."""
+    return matrix.reindex(index=codigos, columns=list(meses)).fillna(1.0)
+
+
+def build_current_seasonality_for_purchase(seasonality_df, fecha_corte=None, matrix=None):
+    if matrix is None:
+        matrix = build_purchase_seasonality_matrix(seasonality_df)
+    if matrix.empty:
+        return pd.DataFrame(columns=["Código", "Factor_Estacional_Compra"])
+
+    mes = current_month(fecha_corte)
+    return pd.DataFrame({
+        "Código": matrix.index,
+        "Factor_Estacional_Compra": matrix[mes].to_numpy(),
+    })
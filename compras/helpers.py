@@ -0,0 +1,93 @@
+"""Utilidades comunes (normalización, fechas, escritura atómica en disco, pools de procesos)."""
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from .config import METODO_PROCESOS
+
+
+# =========================
+# HELPERS
+# =========================
+def norm_code(s):
+    return s.astype(str).str.strip().str.upper()
+
+
+def round_normal(qty):
+    if pd.isna(qty) or qty <= 0:
+        return 0
+    return int(np.ceil(qty))
+
+
+def current_month(fecha_corte=None):
+    if fecha_corte is None:
+        return pd.Timestamp.today().month
+    return pd.Timestamp(fecha_corte).month
+
+
+def next_month(m):
+    return 1 if m == 12 else m + 1
+
+
+def safe_div(a, b):
+    return np.where(np.abs(b) > 1e-9, a / b, 0.0)
+
+
+def clean_numeric_series(s):
+    return pd.to_numeric(s, errors="coerce").replace([np.inf, -np.inf], np.nan).fillna(0)
+
+
+def month_key(fecha):
+    return pd.Timestamp(fecha).strftime("%Y-%m")
+
+
+def month_signature(g):
+    return {"filas": int(len(g)), "ventas": round(float(g["Ventas"].sum()), 6)}
+
+
+def month_signatures(hist):
+    """
+    Firma por mes ("AAAA-MM") de todo un histórico en una pasada, sin agrupar por
+    fecha. Además de filas y ventas totales lleva un hash del contenido (suma de
+    los hashes de Código, Ventas, Importe por fila): una corrección que mueve
+    unidades entre SKUs dentro del mes cambia la firma aunque el total no cambie.
+    """
+    periodo = hist["Año"].to_numpy(dtype=np.int64) * 100 + hist["Mes"].to_numpy(dtype=np.int64)
+    meses, idx, filas = np.unique(periodo, return_inverse=True, return_counts=True)
+    ventas = np.bincount(idx, weights=hist["Ventas"].fillna(0).to_numpy(dtype=float), minlength=len(meses))
+
+    contenido = pd.DataFrame({
+        "Código": hist["Código"].to_numpy(),
+        "Ventas": hist["Ventas"].fillna(0).to_numpy(dtype=float),
+        "Importe": hist["Importe"].fillna(0).to_numpy(dtype=float),
+    })
+    hashes = np.zeros(len(meses), dtype=np.uint64)
+    np.add.at(hashes, idx, pd.util.hash_pandas_object(contenido, index=False).to_numpy())
+
+    return {
+        f"{m // 100:04d}-{m % 100:02d}": {"filas": int(n), "ventas": round(float(v), 6), "hash": f"{h:016x}"}
+        for m, n, v, h in zip(meses, filas, ventas, hashes)
+    }
+
+
+def write_atomic_parquet(df, path):
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def write_atomic_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def process_pool(max_workers, **kwargs):
+    """ProcessPoolExecutor con METODO_PROCESOS en lugar del fork por defecto."""
+    metodo = METODO_PROCESOS if METODO_PROCESOS in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(metodo), **kwargs)
@@ -0,0 +1,323 @@
+"""Lectura de entradas: Erply, histórico mensual, transacciones por bloques e histórico local."""
+import json
+import os
+
+import pandas as pd
+
+from .config import BLOQUES_POR_CONSOLIDACION, COLUMNAS_TRANSACCION, FILAS_POR_BLOQUE
+from .helpers import month_signature, norm_code, write_atomic_json, write_atomic_parquet
+
+
+# =========================
+# ERPLY PARSER
+# =========================
+def read_erply(file):
+    tables = pd.read_html(file, header=None)
+    df = max(tables, key=lambda x: x.shape[0])
+
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [c[0] for c in df.columns]
+
+    def is_code(x):
+        s = str(x).strip()
+        return len(s) >= 3 and not s.lower().startswith("codigo")
+
+    start = 0
+    for i in range(min(100, len(df))):
+        if is_code(df.iloc[i, 1]):
+            start = i
+            break
+
+    df = df.iloc[start:].reset_index(drop=True)
+
+    out = pd.DataFrame({
+        "Código": df.iloc[:, 1].astype(str).str.strip(),
+        "EAN": df.iloc[:, 2].astype(str).str.strip(),
+        "Nombre": df.iloc[:, 3].astype(str).fillna(""),
+        "V30D": pd.to_numeric(df.iloc[:, 4], errors="coerce").fillna(0),
+        "Stock": pd.to_numeric(df.iloc[:, 6], errors="coerce").fillna(0),
+    })
+
+    out["Código"] = norm_code(out["Código"])
+
+    out = out[~out["Código"].str.contains("TOTAL", na=False)]
+    out = out[~out["Nombre"].astype(str).str.upper().str.contains("TOTAL", na=False)]
+
+    return out.reset_index(drop=True)
+
+
+# =========================
+# HISTORICO PREP
+# =========================
+def prepare_hist(hist):
+    hist = hist.copy()
+    hist["Código"] = norm_code(hist["Código"])
+    hist["Ventas"] = pd.to_numeric(hist["Ventas"], errors="coerce").fillna(0)
+    hist["Importe"] = pd.to_numeric(hist["Importe"], errors="coerce").fillna(0)
+    hist["Año"] = pd.to_numeric(hist["Año"], errors="coerce").fillna(0).astype(int)
+    hist["Mes"] = pd.to_numeric(hist["Mes"], errors="coerce").fillna(0).astype(int)
+
+    hist = hist[(hist["Mes"] >= 1) & (hist["Mes"] <= 12) & (hist["Año"] > 0)].copy()
+    return hist
+
+
+# =========================
+# TRANSACCIONES -> HISTORICO MENSUAL (POR BLOQUES)
+# =========================
+def file_name(file):
+    return str(getattr(file, "name", file))
+
+
+def sniff_csv_sep(file):
+    if hasattr(file, "seek"):
+        file.seek(0)
+        linea = file.readline()
+        file.seek(0)
+    else:
+        with open(file, "rb") as fh:
+            linea = fh.readline()
+
+    if isinstance(linea, bytes):
+        linea = linea.decode("utf-8-sig", errors="ignore")
+    return max([",", ";", "\t", "|"], key=linea.count)
+
+
+def resolve_transaction_columns(columns):
+    """
+    Relaciona las columnas del archivo con los nombres canónicos de COLUMNAS_TRANSACCION.
+    Se necesita Código, Ventas, Importe y la fecha (Fecha, o bien Año + Mes): sin
+    Importe el costo de todos los SKUs saldría en 0.
+    """
+    presentes = {str(c).strip(): c for c in columns}
+    cols = {}
+    for canon, alias in COLUMNAS_TRANSACCION.items():
+        for a in alias:
+            if a in presentes:
+                cols[canon] = presentes[a]
+                break
+
+    faltan = [c for c in ["Código", "Ventas", "Importe"] if c not in cols]
+    if "Fecha" not in cols and not ("Año" in cols and "Mes" in cols):
+        faltan.append("Fecha (o Año y Mes)")
+    if faltan:
+        raise ValueError(f"Al archivo de ventas le faltan columnas: {', '.join(faltan)}.")
+
+    return cols
+
+
+def iter_transaction_chunks(file, filas=FILAS_POR_BLOQUE):
+    """
+    Lee el archivo por bloques de `filas` renglones y solo con las columnas necesarias.
+    CSV con el lector por bloques de pandas; Parquet por lotes con pyarrow, sin
+    materializar el archivo completo.
+    """
+    nombre = file_name(file).lower()
+
+    if nombre.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Leer Parquet requiere pyarrow (pip install pyarrow).") from e
+
+        pf = pq.ParquetFile(file)
+        cols = resolve_transaction_columns(pf.schema_arrow.names)
+        for batch in pf.iter_batches(batch_size=filas, columns=list(cols.values())):
+            yield batch.to_pandas(), cols
+        return
+
+    sep = sniff_csv_sep(file)
+    cols = resolve_transaction_columns(pd.read_csv(file, nrows=0, sep=sep).columns)
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+    reader = pd.read_csv(
+        file,
+        sep=sep,
+        usecols=list(cols.values()),
+        dtype={cols["Código"]: str},
+        chunksize=filas,
+    )
+    for chunk in reader:
+        yield chunk, cols
+
+
+def parse_sales_dates(s):
+    """ISO (2025-07-31) o día primero (31/07/2025); formato fijo primero por velocidad."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+
+    s = s.astype(str).str.strip()
+    fecha = pd.to_datetime(s, errors="coerce", format="ISO8601")
+
+    for fmt in ["%d/%m/%Y", "mixed"]:
+        faltan = fecha.isna()
+        if not faltan.any():
+            break
+        fecha[faltan] = pd.to_datetime(s[faltan], errors="coerce", format=fmt, dayfirst=True)
+
+    return fecha
+
+
+def aggregate_transaction_chunk(chunk, cols):
+    out = pd.DataFrame({"Código": norm_code(chunk[cols["Código"]])})
+
+    if "Fecha" in cols:
+        fecha = parse_sales_dates(chunk[cols["Fecha"]])
+        out["Año"] = fecha.dt.year
+        out["Mes"] = fecha.dt.month
+    else:
+        out["Año"] = pd.to_numeric(chunk[cols["Año"]], errors="coerce")
+        out["Mes"] = pd.to_numeric(chunk[cols["Mes"]], errors="coerce")
+
+    out["Ventas"] = pd.to_numeric(chunk[cols["Ventas"]], errors="coerce").fillna(0)
+    out["Importe"] = pd.to_numeric(chunk[cols["Importe"]], errors="coerce").fillna(0)
+
+    out = out.dropna(subset=["Año", "Mes"])
+    out["Año"] = out["Año"].astype(int)
+    out["Mes"] = out["Mes"].astype(int)
+
+    return combine_monthly_partials([out])
+
+
+def combine_monthly_partials(partials):
+    return (
+        pd.concat(partials, ignore_index=True)
+        .groupby(["Código", "Año", "Mes"], as_index=False, sort=False)
+        .agg({"Ventas": "sum", "Importe": "sum"})
+    )
+
+
+def aggregate_transactions(file, filas=FILAS_POR_BLOQUE):
+    """
+    Convierte un export de ventas a nivel día/ticket (CSV o Parquet) al histórico
+    mensual por SKU (Código, Año, Mes, Ventas, Importe).
+    La memoria queda acotada por el tamaño del bloque más el número de pares
+    (SKU, mes) distintos: los parciales se compactan cada BLOQUES_POR_CONSOLIDACION bloques.
+    """
+    parciales = []
+    for chunk, cols in iter_transaction_chunks(file, filas=filas):
+        parciales.append(aggregate_transaction_chunk(chunk, cols))
+        if len(parciales) >= BLOQUES_POR_CONSOLIDACION:
+            parciales = [combine_monthly_partials(parciales)]
+
+    if not parciales:
+        return pd.DataFrame(columns=["Código", "Año", "Mes", "Ventas", "Importe"])
+
+    monthly = combine_monthly_partials(parciales)
+    return monthly.sort_values(["Código", "Año", "Mes"]).reset_index(drop=True)
+
+
+def read_hist(file):
+    """Excel mensual ya agregado, o CSV/Parquet de transacciones agregado por bloques."""
+    nombre = file_name(file).lower()
+    if nombre.endswith((".csv", ".parquet")):
+        return aggregate_transactions(file)
+    return pd.read_excel(file)
+
+
+# =========================
+# HISTORICO LOCAL (SOLO SE AGREGAN MESES)
+# =========================
+COLUMNAS_HISTORICO = ["Código", "Año", "Mes", "Ventas", "Importe"]
+
+
+class HistoryStore:
+    """
+    Histórico mensual consolidado en disco, un Parquet por mes (una fila por
+    Código, Año, Mes). Cada corrida sube solo el delta del mes: se valida, se
+    descartan las claves que ya existen y el resto se agrega. Una fila guardada
+    nunca cambia ni se borra, pero si el delta trae códigos nuevos de un mes ya
+    guardado, el Parquet de ese mes se reescribe (atómicamente) con las filas
+    anteriores más las nuevas. Para reemplazar el histórico completo se usa `replace`.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, "meta.json")
+
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {"version": self.VERSION, "meses": {}}
+        with open(self.meta_path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != self.VERSION:
+            return {"version": self.VERSION, "meses": {}}
+        return meta
+
+    def month_path(self, mes):
+        return os.path.join(self.path, f"mes={mes}.parquet")
+
+    def months(self):
+        return sorted(self.read_meta()["meses"])
+
+    def load(self):
+        meses = self.months()
+        if not meses:
+            return pd.DataFrame(columns=COLUMNAS_HISTORICO)
+        hist = pd.concat([pd.read_parquet(self.month_path(m)) for m in meses], ignore_index=True)
+        return hist.sort_values(["Código", "Año", "Mes"]).reset_index(drop=True)
+
+    def write_months(self, hist, meta):
+        os.makedirs(self.path, exist_ok=True)
+        for (anio, mes), g in hist.groupby(["Año", "Mes"], sort=True):
+            clave = f"{anio:04d}-{mes:02d}"
+            write_atomic_parquet(g.reset_index(drop=True), self.month_path(clave))
+            meta["meses"][clave] = month_signature(g)
+        write_atomic_json(self.meta_path, meta)
+
+    def replace(self, hist):
+        """Reemplaza el almacén con un histórico completo (carga inicial)."""
+        for mes in self.months():
+            os.remove(self.month_path(mes))
+        meta = {"version": self.VERSION, "meses": {}}
+        self.write_months(consolidate_history(hist), meta)
+        return {"meses": len(meta["meses"]), "filas": sum(m["filas"] for m in meta["meses"].values())}
+
+    def append(self, delta):
+        """
+        Agrega un delta de un solo mes. Devuelve un resumen con las filas nuevas y
+        las que se descartaron por tener una clave (Código, Año, Mes) ya guardada.
+        """
+        delta = validate_history_delta(delta)
+        meta = self.read_meta()
+        (anio, mes), = delta[["Año", "Mes"]].drop_duplicates().itertuples(index=False)
+        clave = f"{anio:04d}-{mes:02d}"
+
+        existente = None
+        filas = len(delta)
+        if clave in meta["meses"]:
+            existente = pd.read_parquet(self.month_path(clave))
+            delta = delta[~delta["Código"].isin(existente["Código"])]
+
+        resumen = {"mes": clave, "nuevas": int(len(delta)), "duplicadas": int(filas - len(delta))}
+        if delta.empty:
+            return resumen
+
+        if existente is not None:
+            delta = pd.concat([existente, delta], ignore_index=True).sort_values("Código")
+        self.write_months(delta, meta)
+        return resumen
+
+
+def consolidate_history(hist):
+    """Una fila por (Código, Año, Mes), con las columnas que usa el pipeline."""
+    faltan = [c for c in COLUMNAS_HISTORICO if c not in hist.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas en el histórico: {', '.join(faltan)}")
+    hist = prepare_hist(hist)
+    return hist.groupby(["Código", "Año", "Mes"], as_index=False)[["Ventas", "Importe"]].sum()
+
+
+def validate_history_delta(delta):
+    delta = consolidate_history(delta)
+    if delta.empty:
+        raise ValueError("El delta no tiene filas válidas (Código, Año, Mes).")
+    meses = delta[["Año", "Mes"]].drop_duplicates()
+    if len(meses) > 1:
+        raise ValueError(
+            f"El delta debe traer un solo mes y trae {len(meses)}; "
+            "para cargar varios meses reemplaza el histórico completo."
+        )
+    return delta
@@ -0,0 +1,164 @@
+"""
+Limpieza del histórico antes de las features: picos de promoción y meses de
+quiebre de stock, con estadísticas robustas móviles sobre la matriz SKU x mes.
+"""
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .config import (
+    LIMPIEZA_ESCALA_MIN, LIMPIEZA_K_MAD, MIN_MESES_LIMPIEZA, MIN_NIVEL_QUIEBRE,
+    VENTANA_LIMPIEZA_MESES,
+)
+
+
+# =========================
+# LIMPIEZA DE HISTORICO (PICOS Y QUIEBRES)
+# =========================
+MARCAS_LIMPIEZA = ["", "PICO", "QUIEBRE"]  # posición = marca de clean_sales_matrix
+
+
+def window_median(ordenados, n):
+    """Mediana de ventanas ya ordenadas con NaN al final; `n` = valores válidos por ventana."""
+    plano = ordenados.reshape(-1)
+    fila = np.arange(n.size).reshape(n.shape) * ordenados.shape[-1]
+    bajo = fila + np.maximum((n - 1) // 2, 0)
+    alto = fila + np.maximum(n // 2, 0)
+    return 0.5 * (plano[bajo] + plano[alto])
+
+
+def clean_sales_matrix(x, ventana=VENTANA_LIMPIEZA_MESES):
+    """
+    Limpia una matriz SKU x mes (NaN = mes sin registro). Para cada mes usa la
+    mediana y el MAD de los `ventana` meses calendario que terminan en él:
+    - PICO: venta sobre mediana + LIMPIEZA_K_MAD * escala -> se recorta al tope.
+      El tope nunca queda por debajo del mismo mes del año anterior por
+      (1 + LIMPIEZA_K_MAD * LIMPIEZA_ESCALA_MIN): un pico que se repite cada año
+      (temporada escolar) es estacionalidad, no promoción. Sin año anterior en la
+      matriz no hay referencia y el mes se evalúa solo contra la ventana.
+    - QUIEBRE: venta 0 con mediana >= MIN_NIVEL_QUIEBRE -> se imputa la mediana.
+      Solo se imputan meses con registro en 0; un mes sin registro (NaN) queda
+      igual, porque no hay fila del histórico que corregir.
+    La ventana y el año anterior solo miran hacia atrás: agregar meses nuevos no
+    cambia los ya limpios.
+    Devuelve (matriz limpia, marca) con marca 0 = sin cambio, 1 = pico, 2 = quiebre.
+    """
+    n_sku = x.shape[0]
+    relleno = np.full((n_sku, ventana - 1), np.nan)
+    ventanas = sliding_window_view(np.concatenate([relleno, x], axis=1), ventana, axis=1)
+
+    ordenados = np.sort(ventanas, axis=-1)
+    # Meses con registro por ventana, con sumas acumuladas sobre x (no sobre las ventanas).
+    acumulado = np.concatenate(
+        [np.zeros((n_sku, ventana), dtype=np.int64), np.cumsum(~np.isnan(x), axis=1)], axis=1
+    )
+    n = acumulado[:, ventana:] - acumulado[:, :-ventana]
+    mediana = window_median(ordenados, n)
+    confiable = n >= MIN_MESES_LIMPIEZA
+
+    # Piso del tope por el mismo mes del año anterior (NaN si no hay registro).
+    margen = 1 + LIMPIEZA_K_MAD * LIMPIEZA_ESCALA_MIN
+    piso_anual = np.full(x.shape, np.nan)
+    piso_anual[:, 12:] = x[:, :-12] * margen
+
+    # El tope nunca queda por debajo de mediana * (1 + k * escala mínima) ni del
+    # piso anual: el MAD solo se calcula para los meses que superan ese mínimo.
+    candidatos = confiable & (mediana > 0) & (x > np.fmax(mediana * margen, piso_anual))
+    med_c = mediana[candidatos]
+    desvios = np.sort(np.abs(ventanas[candidatos] - med_c[:, None]), axis=-1)
+    escala = np.maximum(1.4826 * window_median(desvios, n[candidatos]), LIMPIEZA_ESCALA_MIN * med_c)
+    tope = np.fmax(med_c + LIMPIEZA_K_MAD * escala, piso_anual[candidatos])
+
+    limpio = x.copy()
+    marca = np.zeros(x.shape, dtype=np.int8)
+
+    pico = x[candidatos] > tope
+    filas, cols = np.nonzero(candidatos)
+    limpio[filas[pico], cols[pico]] = tope[pico]
+    marca[filas[pico], cols[pico]] = 1
+
+    quiebre = confiable & (x == 0) & (mediana >= MIN_NIVEL_QUIEBRE)
+    limpio[quiebre] = mediana[quiebre]
+    marca[quiebre] = 2
+
+    return limpio, marca
+
+
+def code_index(codigo):
+    """
+    Igual que factorize (orden de aparición). Si cada código ocupa un tramo
+    contiguo, como en un histórico ordenado por Código, basta con comparar filas
+    vecinas y revisar que los códigos de los tramos no se repitan.
+    """
+    valores = codigo.to_numpy()
+    inicio_tramo = np.empty(len(valores), dtype=bool)
+    inicio_tramo[:1] = True
+    np.not_equal(valores[1:], valores[:-1], out=inicio_tramo[1:])
+    codigos = pd.Index(valores[inicio_tramo])
+    if not codigos.is_unique:
+        return codigo.factorize()
+    return np.cumsum(inicio_tramo) - 1, codigos
+
+
+def clean_history(hist):
+    """
+    Histórico con Ventas / Importe limpios y la serie original en Ventas_Raw /
+    Importe_Raw; Limpieza indica PICO, QUIEBRE o "" por fila. Las filas no
+    cambian: un pico se recorta en proporción (conserva el precio de la fila) y un
+    quiebre se reparte entre las filas del mes al precio promedio del SKU. Por lo
+    mismo, un quiebre que dejó el mes sin ninguna fila no se imputa.
+    """
+    out = hist.copy(deep=False)
+    out["Ventas_Raw"] = out["Ventas"]
+    out["Importe_Raw"] = out["Importe"]
+    if out.empty:
+        out["Limpieza"] = pd.Categorical([], categories=MARCAS_LIMPIEZA)
+        return out
+
+    # Matriz SKU x mes: fila = código, columna = ordinal Año * 12 + Mes.
+    codigo_idx, codigos = code_index(out["Código"])
+    ordinal = out["Año"].to_numpy() * 12 + out["Mes"].to_numpy()
+    inicio = ordinal.min()
+    n_meses = ordinal.max() - inicio + 1
+    clave = codigo_idx * n_meses + (ordinal - inicio)
+
+    ventas = out["Ventas"].to_numpy(dtype=float)
+    importe = out["Importe"].to_numpy(dtype=float)
+    tamano = len(codigos) * n_meses
+    filas_clave = np.bincount(clave, minlength=tamano)
+    ventas_clave = np.bincount(clave, weights=ventas, minlength=tamano)
+
+    x = np.where(filas_clave > 0, ventas_clave, np.nan).reshape(len(codigos), n_meses)
+    limpio, marca = clean_sales_matrix(x)
+    marca = marca.ravel()[clave]
+
+    # Solo las filas marcadas cambian; el resto conserva Ventas / Importe originales.
+    filas = np.flatnonzero(marca)
+    clave_f, marca_f = clave[filas], marca[filas]
+    limpio_f = limpio.ravel()[clave_f]
+    original_f = ventas_clave[clave_f]
+
+    ventas_sku = np.bincount(codigo_idx, weights=ventas, minlength=len(codigos))
+    importe_sku = np.bincount(codigo_idx, weights=importe, minlength=len(codigos))
+    precio_f = np.divide(importe_sku, ventas_sku, out=np.zeros(len(codigos)), where=ventas_sku > 0)[codigo_idx[filas]]
+
+    factor = np.divide(limpio_f, original_f, out=np.ones(len(filas)), where=original_f != 0)
+    reparto = limpio_f / filas_clave[clave_f]
+    es_pico = marca_f == 1
+
+    nuevas_ventas = ventas.copy()
+    nuevo_importe = importe.copy()
+    nuevas_ventas[filas] = np.where(es_pico, ventas[filas] * factor, reparto)
+    nuevo_importe[filas] = np.where(es_pico, importe[filas] * factor, reparto * precio_f)
+
+    out["Ventas"] = nuevas_ventas
+    out["Importe"] = nuevo_importe
+    out["Limpieza"] = pd.Categorical.from_codes(marca, MARCAS_LIMPIEZA, validate=False)
+    return out
+
+
+def raw_history(hist):
+    """Serie original de un histórico limpio (para costo y ventas por mes reportadas)."""
+    if "Ventas_Raw" not in hist.columns:
+        return hist
+    return hist.assign(Ventas=hist["Ventas_Raw"], Importe=hist["Importe_Raw"])
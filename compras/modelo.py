@@ -0,0 +1,255 @@
+"""Ridge global en NumPy, pronóstico por SKU e incertidumbre de la demanda."""
+import pandas as pd
+import numpy as np
+
+from .config import (
+    CUANTILES_DEMANDA, MIN_FILAS_ENTRENAMIENTO, MIN_RESIDUALES_SEGMENTO, NIVEL_SERVICIO,
+    RIDGE_ALPHA,
+)
+from .helpers import next_month
+
+
+# =========================
+# RIDGE REGRESSION CON NUMPY
+# =========================
+class NumpyRidgeRegression:
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.coef_ = None
+        self.intercept_ = None
+        self.feature_names_ = None
+        self.is_fitted_ = False
+
+    def fit(self, X, y, feature_names=None):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        if X.ndim != 2:
+            raise ValueError("X debe ser 2D.")
+        if y.ndim != 1:
+            raise ValueError("y debe ser 1D.")
+        if len(X) != len(y):
+            raise ValueError("X e y deben tener la misma longitud.")
+
+        XtX, Xty = ridge_gram(X, y)
+        return self.fit_gram(XtX, Xty, feature_names=feature_names)
+
+    def fit_gram(self, XtX, Xty, feature_names=None):
+        """
+        Ajuste a partir de las matrices X'X y X'y (con columna de intercepto).
+        Permite ajustar un modelo sobre datos de varias tiendas sumando sus
+        matrices, sin juntar las filas de entrenamiento en un solo proceso.
+        """
+        n_features = XtX.shape[0]
+
+        I = np.eye(n_features)
+        I[0, 0] = 0.0
+
+        beta = np.linalg.solve(XtX + self.alpha * I, Xty)
+
+        self.intercept_ = float(beta[0])
+        self.coef_ = beta[1:]
+        self.feature_names_ = feature_names if feature_names is not None else []
+        self.is_fitted_ = True
+        return self
+
+    def predict(self, X):
+        if not self.is_fitted_:
+            raise ValueError("El modelo no ha sido entrenado.")
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError("X debe ser 2D.")
+        return self.intercept_ + X @ self.coef_
+
+
+def ridge_gram(X, y):
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    X_design = np.column_stack([np.ones(len(X)), X])
+    return X_design.T @ X_design, X_design.T @ y
+
+
+# =========================
+# REGRESION GLOBAL (PRONOSTICO POR SKU)
+# =========================
+def get_feature_cols():
+    return [
+        "lag1", "lag2", "lag3", "lag6", "lag12",
+        "ma3", "std3", "max3", "min3",
+        "diff1", "diff2", "ratio1", "ratio2",
+        "trend_idx", "Mes_sin", "Mes_cos"
+    ]
+
+
+def train_global_regression(train):
+    feature_cols = get_feature_cols()
+
+    if train.empty or len(train) < MIN_FILAS_ENTRENAMIENTO:
+        return None, feature_cols
+
+    X, y = training_matrices(train, feature_cols)
+
+    model = NumpyRidgeRegression(alpha=RIDGE_ALPHA).fit(X, y, feature_names=feature_cols)
+    return model, feature_cols
+
+
+def training_matrices(train, feature_cols):
+    train = train.copy()
+    for c in feature_cols:
+        if c not in train.columns:
+            train[c] = 0.0
+
+    X = train[feature_cols].fillna(0).values
+    y = train["Ventas"].fillna(0).values
+    return X, y
+
+
+def predict_next_month_per_sku(monthly, model, feature_cols):
+    if model is None:
+        return pd.DataFrame(columns=["Código", "Pred_Regresion_Mensual", "Meses_Historial"])
+
+    rows = []
+
+    for codigo, g in monthly.groupby("Código"):
+        g = g.sort_values("Fecha").reset_index(drop=True)
+        ventas = g["Ventas"].tolist()
+
+        meses_historial = int((g["Ventas"] > 0).sum())
+
+        last1 = ventas[-1] if len(ventas) >= 1 else 0
+        last2 = ventas[-2] if len(ventas) >= 2 else 0
+        last3 = ventas[-3] if len(ventas) >= 3 else 0
+        last6 = ventas[-6] if len(ventas) >= 6 else 0
+        last12 = ventas[-12] if len(ventas) >= 12 else 0
+
+        vals3 = np.array([last1, last2, last3], dtype=float)
+
+        ma3 = float(np.mean(vals3))
+        std3 = float(np.std(vals3))
+        max3 = float(np.max(vals3))
+        min3 = float(np.min(vals3))
+
+        diff1 = float(last1 - last2)
+        diff2 = float(last2 - last3)
+        ratio1 = float(last1 / (last2 + 1))
+        ratio2 = float(last2 / (last3 + 1))
+        trend_idx = float(len(g) + 1)
+
+        last_fecha = g["Fecha"].iloc[-1]
+        pred_month = next_month(last_fecha.month)
+
+        mes_sin = float(np.sin(2 * np.pi * pred_month / 12))
+        mes_cos = float(np.cos(2 * np.pi * pred_month / 12))
+
+        X_pred = pd.DataFrame([{
+            "lag1": last1, "lag2": last2, "lag3": last3,
+            "lag6": last6, "lag12": last12,
+            "ma3": ma3, "std3": std3, "max3": max3, "min3": min3,
+            "diff1": diff1, "diff2": diff2,
+            "ratio1": ratio1, "ratio2": ratio2,
+            "trend_idx": trend_idx,
+            "Mes_sin": mes_sin, "Mes_cos": mes_cos
+        }])
+
+        for c in feature_cols:
+            if c not in X_pred.columns:
+                X_pred[c] = 0.0
+
+        X_pred = X_pred[feature_cols].replace([np.inf, -np.inf], np.nan).fillna(0)
+        pred = model.predict(X_pred.values)[0]
+        pred = max(0, pred)
+
+        rows.append({
+            "Código": codigo,
+            "Pred_Regresion_Mensual": pred,
+            "Meses_Historial": meses_historial
+        })
+
+    return pd.DataFrame(rows)
+
+
+# =========================
+# INCERTIDUMBRE DE DEMANDA (RESIDUALES RIDGE)
+# =========================
+def get_quantile_levels():
+    return sorted(set(CUANTILES_DEMANDA) | {NIVEL_SERVICIO})
+
+
+def quantile_col(nivel):
+    return f"Demanda_P{int(round(nivel * 100)):02d}"
+
+
+def residual_scale(demanda):
+    """Escala del error: raíz del volumen, con piso de 1 pieza."""
+    return np.sqrt(np.maximum(demanda, 1.0))
+
+
+def build_residual_quantiles(train, model, feature_cols, segmentation):
+    """
+    Cuantiles empíricos del error de la Ridge por segmento.
+    El error se estabiliza en varianza: (real - pronóstico) / sqrt(max(pronóstico, 1)).
+    Con ventas tipo conteo la dispersión crece como la raíz del volumen, así que un
+    mismo cuantil sirve a SKUs de alto y bajo volumen; el error relativo sobrestimaba
+    el margen de los SKUs grandes varias veces.
+    Devuelve un DataFrame indexado por segmento (incluye "GLOBAL" y
+    "SIN_HISTORICO") con una columna por nivel de cuantil. SIN_HISTORICO toma el
+    cuantil más alto de todos los segmentos: sus residuales son casi todos 0 y
+    darían un margen nulo a los SKUs de los que menos se sabe.
+    """
+    niveles = get_quantile_levels()
+
+    if model is None or train.empty:
+        return pd.DataFrame(columns=niveles, dtype=float)
+
+    X = train.reindex(columns=feature_cols).fillna(0).values
+    y = train["Ventas"].fillna(0).values
+
+    pred = np.maximum(model.predict(X), 0)
+    error = (y - pred) / residual_scale(pred)
+
+    segmento = train["Código"].map(
+        segmentation.drop_duplicates("Código").set_index("Código")["Segmento_GMM"]
+    ).fillna("SIN_HISTORICO")
+
+    errores = pd.DataFrame({"Segmento": segmento.values, "Error": error})
+    g = errores.groupby("Segmento")["Error"]
+
+    quantiles = g.quantile(niveles).unstack()
+    quantiles = quantiles[g.size().reindex(quantiles.index) >= MIN_RESIDUALES_SEGMENTO]
+    quantiles.loc["GLOBAL"] = np.quantile(error, niveles)
+    quantiles.loc["SIN_HISTORICO"] = quantiles.max()
+    quantiles.columns = niveles
+
+    return quantiles
+
+
+def apply_demand_uncertainty(final, residual_q):
+    """
+    Cuantiles de demanda por SKU y stock de seguridad según NIVEL_SERVICIO.
+    Todo se resuelve como una búsqueda del cuantil del segmento y una
+    multiplicación matricial SKUs x niveles, sin recorrer filas.
+    """
+    final = final.copy()
+    niveles = get_quantile_levels()
+    base = final["Demanda_Ajustada_Estacional"].to_numpy(dtype=float)
+
+    if residual_q.empty:
+        q = np.zeros((len(final), len(niveles)))
+    else:
+        q = (
+            residual_q.reindex(final["Segmento_GMM"].values)
+            .fillna(residual_q.loc["GLOBAL"])
+            .to_numpy(dtype=float)
+        )
+
+    # Sin demanda esperada no hay margen que cubrir.
+    escala = np.where(base > 0, residual_scale(base), 0.0)
+    demanda_q = np.clip(base[:, None] + escala[:, None] * q, 0, None)
+
+    for j, nivel in enumerate(niveles):
+        final[quantile_col(nivel)] = demanda_q[:, j]
+
+    servicio = demanda_q[:, niveles.index(NIVEL_SERVICIO)]
+    final["Stock_Seguridad"] = np.ceil(np.clip(servicio - base, 0, None))
+
+    return final
@@ -0,0 +1,300 @@
+"""Corridas de varias tiendas en paralelo y traspasos entre tiendas."""
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from .config import (
+    COBERTURA_EXCEDENTE, COBERTURA_NIVEL_CRITICO, COBERTURA_RETENER_DONANTE, DIR_CACHE,
+    MIN_FILAS_ENTRENAMIENTO, RIDGE_ALPHA, USAR_FEATURE_STORE, USAR_LIMPIEZA_HISTORIA, USAR_REBALANCEO,
+)
+from .helpers import process_pool
+from .ingesta import prepare_hist, read_erply, read_hist
+from .features import MonthlyFeatureStore, build_monthly_features
+from .limpieza import clean_history
+from .modelo import NumpyRidgeRegression, get_feature_cols, ridge_gram, training_matrices
+from .politica import build_purchase_frame, finalize_purchase_table
+from .exportacion import write_purchase_table
+from .artefacto import load_model_artifact
+
+
+# =========================
+# MULTI-TIENDA (PROCESOS EN PARALELO)
+# =========================
+def read_manifest(path):
+    """
+    Manifiesto CSV o JSON con una fila por tienda: Tienda, Historico, Erply.
+    Las rutas relativas se resuelven contra la carpeta del manifiesto.
+    """
+    if str(path).lower().endswith(".json"):
+        with open(path, encoding="utf-8") as fh:
+            manifest = pd.DataFrame(json.load(fh))
+    else:
+        manifest = pd.read_csv(path, dtype=str)
+
+    manifest.columns = [str(c).strip().capitalize() for c in manifest.columns]
+    faltan = [c for c in ["Tienda", "Historico", "Erply"] if c not in manifest.columns]
+    if faltan:
+        raise ValueError(f"Al manifiesto le faltan columnas: {', '.join(faltan)}.")
+
+    base = os.path.dirname(os.path.abspath(path))
+    for c in ["Historico", "Erply"]:
+        manifest[c] = manifest[c].astype(str).str.strip().map(
+            lambda f: f if os.path.isabs(f) else os.path.join(base, f)
+        )
+    manifest["Tienda"] = manifest["Tienda"].astype(str).str.strip()
+
+    if manifest["Tienda"].duplicated().any():
+        raise ValueError("El manifiesto tiene tiendas repetidas.")
+
+    return manifest[["Tienda", "Historico", "Erply"]].reset_index(drop=True)
+
+
+def store_feature_store(tienda):
+    if not USAR_FEATURE_STORE:
+        return None
+    return MonthlyFeatureStore(os.path.join(DIR_CACHE, "features", str(tienda)))
+
+
+def store_gram(entry):
+    """
+    Worker: matrices X'X, X'y de una tienda. Solo viajan las matrices (tamaño fijo
+    por número de features); el histórico se vuelve a leer en build_store_frame.
+    Entrena sobre el mismo histórico limpio que build_purchase_frame, así la Ridge
+    compartida ve los mismos datos y el feature store de la tienda no se reconstruye
+    dos veces por corrida.
+    """
+    tienda, hist_path, erply_path = entry
+    hist = prepare_hist(read_hist(hist_path))
+    if USAR_LIMPIEZA_HISTORIA:
+        hist = clean_history(hist)
+
+    feature_store = store_feature_store(tienda)
+    if feature_store is not None:
+        _, train = feature_store.update(hist)
+    else:
+        _, train = build_monthly_features(hist)
+
+    X, y = training_matrices(train, get_feature_cols())
+    XtX, Xty = ridge_gram(X, y)
+    return XtX, Xty, len(y)
+
+
+def shared_model_context(path):
+    """Ridge compartida desde un artefacto (memory map); el resto del contexto es de cada tienda."""
+    ctx = load_model_artifact(path, con_gmm=False)
+    if ctx["modelo"] is None or ctx["feature_cols"] != get_feature_cols():
+        raise ValueError(f"El artefacto {path} no tiene una Ridge compatible.")
+    return {"modelo": ctx["modelo"], "feature_cols": ctx["feature_cols"]}
+
+
+def build_store_frame(job):
+    """
+    Worker: lee los archivos de una tienda y corre build_purchase_frame (sin
+    filtrar). `contexto` puede ser la ruta de un artefacto del modelo; cada
+    worker lo abre en memory map.
+    """
+    tienda, hist_path, erply_path, contexto, fecha_corte = job
+    hist, vs = prepare_hist(read_hist(hist_path)), read_erply(erply_path)
+    if isinstance(contexto, str):
+        contexto = shared_model_context(contexto)
+    final, gmm_error = build_purchase_frame(
+        vs, hist, feature_store=store_feature_store(tienda), contexto=contexto,
+        fecha_corte=fecha_corte, particiones=1,
+    )
+    return tienda, final, gmm_error
+
+
+def fit_pooled_regression(grams):
+    """Ridge global a partir de las matrices de cada tienda (suma en orden de manifiesto)."""
+    n = sum(g[2] for g in grams)
+    if n < MIN_FILAS_ENTRENAMIENTO:
+        return None
+
+    XtX = sum(g[0] for g in grams)
+    Xty = sum(g[1] for g in grams)
+    return NumpyRidgeRegression(alpha=RIDGE_ALPHA).fit_gram(
+        XtX, Xty, feature_names=get_feature_cols()
+    )
+
+
+def run_multi_store(manifest, salida, workers=None, modelo_global=True, rebalanceo=USAR_REBALANCEO,
+                    formato="csv", fecha_corte=None, modelo=None):
+    """
+    Corre el análisis para todas las tiendas del manifiesto en un pool de procesos.
+    Con `modelo_global` la Ridge se ajusta una vez con los datos de todas las
+    tiendas y se comparte; si no, cada tienda entrena la suya. Con `modelo` (ruta
+    de un artefacto, ver compras.artefacto) se usa esa Ridge sin reajustar.
+    Con `rebalanceo` los traspasos entre tiendas se descuentan de la compra.
+    `fecha_corte` fija el mes de planeación (por defecto, hoy).
+    Escribe compra_<tienda>.<formato> por tienda, compra_consolidada.<formato> y traspasos.csv.
+    Devuelve (consolidado, traspasos, avisos).
+    """
+    if isinstance(manifest, str):
+        manifest = read_manifest(manifest)
+
+    if modelo:
+        modelo = os.path.abspath(modelo)
+        shared_model_context(modelo)  # falla antes de leer las tiendas si el artefacto no sirve
+
+    os.makedirs(salida, exist_ok=True)
+    entries = list(manifest[["Tienda", "Historico", "Erply"]].itertuples(index=False, name=None))
+    workers = workers or os.cpu_count() or 1
+
+    # Cada proceso lee los archivos de su tienda: al proceso principal solo vuelven
+    # las matrices de la Ridge y la tabla de cada tienda.
+    with process_pool(min(workers, len(entries)) or 1) as pool:
+        contexto = None
+        if modelo:
+            contexto = modelo
+        elif modelo_global:
+            model = fit_pooled_regression(list(pool.map(store_gram, entries)))
+            contexto = {"modelo": model, "feature_cols": get_feature_cols()}
+
+        jobs = [
+            (tienda, hist_path, erply_path, dict(contexto) if isinstance(contexto, dict) else contexto,
+             fecha_corte)
+            for tienda, hist_path, erply_path in entries
+        ]
+        results = list(pool.map(build_store_frame, jobs))
+
+    avisos = [f"{tienda}: GMM omitido ({gmm_error})" for tienda, _, gmm_error in results if gmm_error]
+    frames = {tienda: final for tienda, final, _ in results}
+
+    traspasos = plan_stock_transfers(frames) if rebalanceo else empty_transfers()
+    if rebalanceo:
+        frames = apply_stock_transfers(frames, traspasos)
+    traspasos.to_csv(os.path.join(salida, "traspasos.csv"), index=False, encoding="utf-8-sig")
+
+    tablas = []
+    for tienda, final in frames.items():
+        tabla = finalize_purchase_table(final)
+        write_purchase_table(tabla, os.path.join(salida, f"compra_{tienda}.{formato}"))
+        tablas.append(tabla.assign(Tienda=tienda))
+
+    consolidado = pd.concat(tablas, ignore_index=True)
+    consolidado = consolidado[["Tienda"] + [c for c in consolidado.columns if c != "Tienda"]]
+    write_purchase_table(consolidado, os.path.join(salida, f"compra_consolidada.{formato}"))
+
+    return consolidado, traspasos, avisos
+
+
+# =========================
+# REBALANCEO ENTRE TIENDAS
+# =========================
+def empty_transfers():
+    return pd.DataFrame({
+        "Código": pd.Series(dtype=object),
+        "Tienda_Origen": pd.Series(dtype=object),
+        "Tienda_Destino": pd.Series(dtype=object),
+        "Cantidad": pd.Series(dtype="int64"),
+    })
+
+
+def plan_stock_transfers(frames):
+    """
+    Propone traspasos de tiendas con excedente a tiendas en nivel CRITICO.
+
+    Receptores: Cobertura < COBERTURA_NIVEL_CRITICO con Compra > 0; piden hasta su Compra.
+    Donantes: Cobertura > COBERTURA_EXCEDENTE; ceden lo que sobra de
+    COBERTURA_RETENER_DONANTE meses de demanda.
+
+    El emparejamiento es un barrido sobre intervalos acumulados: por SKU, los
+    receptores (más crítico primero) y los donantes (mayor excedente primero)
+    ocupan tramos consecutivos de [0, min(pedido, oferta)). Todos los SKUs se
+    colocan uno tras otro en un mismo eje, así que cada tramo elemental entre
+    dos cortes pertenece a exactamente un receptor y un donante y se resuelve
+    con un searchsorted para todo el catálogo a la vez.
+    """
+    if len(frames) < 2:
+        return empty_transfers()
+
+    stacked = pd.concat(
+        [f[["Código", "Stock", "Demanda30", "Compra"]].assign(Tienda=t) for t, f in frames.items()],
+        ignore_index=True
+    )
+    stock = stacked["Stock"].clip(lower=0).to_numpy(dtype=float)
+    demanda = stacked["Demanda30"].to_numpy(dtype=float)
+    cobertura = np.divide(stock, demanda, out=np.full(len(stock), np.inf), where=demanda > 0)
+
+    stacked["Cobertura"] = cobertura
+    stacked["Pedido"] = np.where(
+        (cobertura < COBERTURA_NIVEL_CRITICO) & (demanda > 0),
+        stacked["Compra"].to_numpy(dtype=float), 0
+    ).astype(np.int64)
+    stacked["Oferta"] = np.where(
+        cobertura > COBERTURA_EXCEDENTE,
+        np.floor(stock - np.ceil(demanda * COBERTURA_RETENER_DONANTE)), 0
+    ).clip(min=0).astype(np.int64)
+
+    rec = stacked[stacked["Pedido"] > 0]
+    don = stacked[stacked["Oferta"] > 0]
+    codigos = np.intersect1d(rec["Código"].unique(), don["Código"].unique())
+    if len(codigos) == 0:
+        return empty_transfers()
+
+    rec = rec[rec["Código"].isin(codigos)].sort_values(
+        ["Código", "Cobertura", "Tienda"], kind="mergesort"
+    ).reset_index(drop=True)
+    don = don[don["Código"].isin(codigos)].sort_values(
+        ["Código", "Oferta", "Tienda"], ascending=[True, False, True], kind="mergesort"
+    ).reset_index(drop=True)
+
+    tope = np.minimum(
+        rec.groupby("Código")["Pedido"].sum().reindex(codigos).to_numpy(),
+        don.groupby("Código")["Oferta"].sum().reindex(codigos).to_numpy(),
+    )
+    inicio_sku = pd.Series(np.cumsum(tope) - tope, index=codigos)
+    tope = pd.Series(tope, index=codigos)
+
+    def tramos(df, col):
+        fin = df.groupby("Código")[col].cumsum().to_numpy()
+        ini = fin - df[col].to_numpy()
+        cap = tope.reindex(df["Código"]).to_numpy()
+        off = inicio_sku.reindex(df["Código"]).to_numpy()
+        ini = off + np.minimum(ini, cap)
+        fin = off + np.minimum(fin, cap)
+        keep = fin > ini
+        return df[keep].reset_index(drop=True), fin[keep]
+
+    rec, fin_rec = tramos(rec, "Pedido")
+    don, fin_don = tramos(don, "Oferta")
+
+    cortes = np.union1d(fin_rec, fin_don)
+    inicios = np.concatenate([[0], cortes[:-1]])
+
+    i_rec = np.searchsorted(fin_rec, inicios, side="right")
+    i_don = np.searchsorted(fin_don, inicios, side="right")
+
+    traspasos = pd.DataFrame({
+        "Código": rec["Código"].to_numpy()[i_rec],
+        "Tienda_Origen": don["Tienda"].to_numpy()[i_don],
+        "Tienda_Destino": rec["Tienda"].to_numpy()[i_rec],
+        "Cantidad": (cortes - inicios).astype(np.int64),
+    })
+
+    return traspasos[traspasos["Cantidad"] > 0].reset_index(drop=True)
+
+
+def apply_stock_transfers(frames, traspasos):
+    """Descuenta de la Compra lo que llega por traspaso y anota entradas y salidas."""
+    out = {}
+    for tienda, final in frames.items():
+        final = final.copy()
+        entrada = traspasos[traspasos["Tienda_Destino"] == tienda].groupby("Código")["Cantidad"].sum()
+        salida = traspasos[traspasos["Tienda_Origen"] == tienda].groupby("Código")["Cantidad"].sum()
+
+        final["Traspaso_Entrada"] = final["Código"].map(entrada).fillna(0).astype(int)
+        final["Traspaso_Salida"] = final["Código"].map(salida).fillna(0).astype(int)
+        final["Compra"] = (final["Compra"] - final["Traspaso_Entrada"]).clip(lower=0)
+
+        final["Relacion_Compra_Demanda"] = np.where(
+            final["Demanda30"] > 0,
+            final["Compra"] / final["Demanda30"],
+            0
+        )
+        final["Porcentaje_Compra_Demanda"] = (final["Relacion_Compra_Demanda"] * 100).round(1)
+        out[tienda] = final
+
+    return out
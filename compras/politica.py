@@ -0,0 +1,487 @@
+"""Tabla de compra: une las etapas por SKU y aplica la política del mes de planeación."""
+import os
+
+import pandas as pd
+import numpy as np
+
+from .config import (
+    COBERTURA_NIVEL_CRITICO, COBERTURA_NIVEL_MEDIO, COMPRA_MINIMA_UNIDAD,
+    MAX_FACTOR_SOBRE_HISTORICO, MAX_FACTOR_SOBRE_V30D, MIN_MESES_PARA_REGRESION, MIN_ROTACION_V30D,
+    MIN_SKUS_PARTICIONAR, PARTICIONES_SKU, USAR_ESTACIONALIDAD, USAR_LIMPIEZA_HISTORIA,
+    USAR_STOCK_SEGURIDAD,
+)
+from .helpers import current_month, process_pool, round_normal
+from .features import (
+    add_lag_features, aggregate_monthly, build_cost, build_purchase_seasonality_matrix,
+    build_school_demand, build_seasonality, build_v05_v06, fill_missing_costs_with_global_average,
+    global_average_cost, seasonality_for_months, split_training_rows,
+)
+from .limpieza import clean_history, raw_history
+from .modelo import (
+    apply_demand_uncertainty, build_residual_quantiles, get_feature_cols,
+    predict_next_month_per_sku, train_global_regression,
+)
+from .segmentacion import (
+    SEGMENTATION_COLS, apply_dynamic_profile_params, behavior_percentiles, behavior_window,
+    build_sku_behavior_features, fit_gmm_clusters, segment_behavior,
+)
+
+
+# =========================
+# SEGURIDAD DE REGRESION DINAMICA
+# =========================
+def apply_regression_safety(final):
+    final = final.copy()
+
+    final["Meses_Historial"] = final["Meses_Historial"].fillna(0)
+    final["Pred_Regresion_Usable"] = final["Pred_Regresion_Mensual"]
+
+    final["Pred_Regresion_Usable"] = np.where(
+        final["Meses_Historial"] >= MIN_MESES_PARA_REGRESION,
+        final["Pred_Regresion_Usable"],
+        final["Demanda_Mensual_Historica"]
+    )
+
+    max_hist = final.get("Max_Factor_Hist_Dyn", MAX_FACTOR_SOBRE_HISTORICO)
+    max_v30d = final.get("Max_Factor_V30D_Dyn", MAX_FACTOR_SOBRE_V30D)
+
+    limite_hist = np.where(
+        final["Demanda_Mensual_Historica"] > 0,
+        final["Demanda_Mensual_Historica"] * max_hist,
+        np.nan
+    )
+
+    limite_v30d = np.where(
+        final["V30D"] > 0,
+        final["V30D"] * max_v30d,
+        np.nan
+    )
+
+    limite_final = np.where(
+        ~np.isnan(limite_hist) & ~np.isnan(limite_v30d),
+        np.minimum(limite_hist, limite_v30d),
+        np.where(~np.isnan(limite_hist), limite_hist, limite_v30d)
+    )
+
+    final["Pred_Regresion_Usable"] = np.where(
+        ~np.isnan(limite_final),
+        np.minimum(final["Pred_Regresion_Usable"], limite_final),
+        final["Pred_Regresion_Usable"]
+    )
+
+    final["Pred_Regresion_Usable"] = final["Pred_Regresion_Usable"].clip(lower=0)
+
+    return final
+
+
+# =========================
+# SHARDS POR SKU
+# =========================
+def resolve_partitions(hist, particiones=None):
+    if particiones is None:
+        particiones = PARTICIONES_SKU
+    if particiones is None:
+        grande = hist["Código"].nunique() >= MIN_SKUS_PARTICIONAR
+        particiones = (os.cpu_count() or 1) if grande else 1
+    return max(1, int(particiones))
+
+
+def shard_by_sku(df, particiones):
+    """
+    Reparte las filas en shards por hash estable del Código: un SKU siempre cae
+    en el mismo shard, en cualquier proceso y corrida. Omite shards vacíos.
+    """
+    if particiones <= 1:
+        return [df]
+
+    codigos = pd.Series(df["Código"].unique())
+    shard = pd.Series(
+        pd.util.hash_pandas_object(codigos, index=False).to_numpy() % particiones,
+        index=codigos.values,
+    )
+    ids = df["Código"].map(shard).to_numpy()
+    shards = [df[ids == i] for i in range(particiones)]
+    return [sh for sh in shards if not sh.empty] or [df]
+
+
+def map_shards(pool, fn, jobs):
+    if pool is None:
+        return [fn(job) for job in jobs]
+    return list(pool.map(fn, jobs))
+
+
+def concat_sorted(frames, by):
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True).sort_values(by, kind="mergesort").reset_index(drop=True)
+
+
+def sku_stage_frames(hist, fechas, con_mensual=True):
+    """
+    Etapas que solo dependen del histórico de cada SKU (más la ventana de 24M del
+    catálogo). Con un histórico limpio, costo y ventas por mes usan la serie original.
+    """
+    crudo = raw_history(hist)
+    etapas = {
+        "cost": build_cost(crudo),
+        "school": build_school_demand(hist),
+        "ventas_mes": build_v05_v06(crudo),
+        "estacionalidad": build_purchase_seasonality_matrix(build_seasonality(hist)),
+        "features": build_sku_behavior_features(hist, fechas=fechas),
+    }
+    if con_mensual:
+        etapas["monthly"] = add_lag_features(aggregate_monthly(hist))
+    return etapas
+
+
+def sku_stage_frames_job(job):
+    return sku_stage_frames(*job)
+
+
+def predict_shard_job(job):
+    return predict_next_month_per_sku(*job)
+
+
+def merge_sku_stage_frames(partes):
+    """Une los shards en el mismo orden (por Código) que produce la corrida en un solo proceso."""
+    if len(partes) == 1:
+        return partes[0]
+
+    etapas = {
+        "cost": concat_sorted([p["cost"] for p in partes], ["Código"]),
+        "school": concat_sorted([p["school"] for p in partes], ["Código"]),
+        "ventas_mes": tuple(
+            pd.concat([p["ventas_mes"][i] for p in partes]).sort_index(kind="mergesort")
+            for i in range(3)
+        ),
+        "estacionalidad": pd.concat([p["estacionalidad"] for p in partes]).sort_index(kind="mergesort"),
+        "features": concat_sorted([p["features"] for p in partes], ["Código"]),
+    }
+    if "monthly" in partes[0]:
+        etapas["monthly"] = concat_sorted([p["monthly"] for p in partes], ["Código", "Fecha"])
+    return etapas
+
+
+# =========================
+# MODELO FINAL
+# =========================
+def build_final_table(vs, hist, feature_store=None, contexto=None, diagnostico=False, fecha_corte=None,
+                      particiones=None):
+    """
+    Tabla de compra para una tienda. `contexto` puede traer estado de catálogo ya
+    ajustado (p. ej. la Ridge global de varias tiendas); ver build_purchase_frame.
+    """
+    final, gmm_error = build_purchase_frame(
+        vs, hist, feature_store=feature_store, contexto=contexto, diagnostico=diagnostico,
+        fecha_corte=fecha_corte, particiones=particiones,
+    )
+    return finalize_purchase_table(final), gmm_error
+
+
+def build_purchase_frame(vs, hist, feature_store=None, contexto=None, diagnostico=False,
+                         monthly_features=None, fecha_corte=None, particiones=None):
+    """
+    Cálculo completo para todos los SKUs del Erply, antes de filtrar por compra.
+
+    `contexto` (dict) guarda el estado ajustado a nivel catálogo: Ridge, ventana de
+    24 meses, percentiles p25/p75, costo global, cuantiles de residuales y features
+    de comportamiento. Lo que ya trae se reutiliza y lo que falta se calcula y se
+    agrega, de modo que explain_sku puede recalcular un solo SKU con el estado del
+    catálogo completo.
+
+    Con `diagnostico=False` solo se calcula lo que alimenta Compra y las columnas
+    visibles. El GMM, Revisar_GMM, Tipo, Cobertura/Nivel y demás columnas de
+    diagnóstico se calculan con `diagnostico=True` (ver explain_sku).
+
+    `fecha_corte` fija el mes de planeación (por defecto, hoy) y `particiones` el
+    número de shards por SKU (por defecto, automático según PARTICIONES_SKU).
+    """
+    ctx = {} if contexto is None else contexto
+    base, gmm_error = build_sku_base(
+        vs, hist, ctx, feature_store=feature_store, diagnostico=diagnostico,
+        monthly_features=monthly_features, particiones=particiones,
+    )
+    final = apply_purchase_policy(base, ctx, fecha_corte=fecha_corte, diagnostico=diagnostico)
+    return final, gmm_error
+
+
+def build_sku_base(vs, hist, ctx, feature_store=None, diagnostico=False, monthly_features=None,
+                   particiones=None):
+    """
+    Parte de build_purchase_frame que no depende del mes de planeación: costos,
+    pronóstico Ridge, segmentación, parámetros por perfil y demanda base.
+    La matriz de estacionalidad de compra (SKU x 12) queda en `ctx`.
+
+    Con `particiones` > 1 las etapas por SKU corren en un pool de procesos sobre
+    shards del histórico (ver shard_by_sku); Ridge, percentiles, residuales y GMM
+    se calculan una sola vez con los resultados unidos.
+    """
+    if "fechas_24m" not in ctx:
+        ctx["fechas_24m"] = behavior_window(hist)
+
+    limpio = clean_history(hist) if USAR_LIMPIEZA_HISTORIA else hist
+
+    con_mensual = monthly_features is None and feature_store is None
+    shards = shard_by_sku(limpio, resolve_partitions(hist, particiones))
+    pool = process_pool(len(shards)) if len(shards) > 1 else None
+
+    try:
+        etapas = merge_sku_stage_frames(map_shards(
+            pool, sku_stage_frames_job, [(h, ctx["fechas_24m"], con_mensual) for h in shards]
+        ))
+
+        if monthly_features is not None:
+            monthly, train = monthly_features
+        elif feature_store is not None:
+            monthly, train = feature_store.update(limpio)
+        else:
+            monthly = etapas["monthly"]
+            train = split_training_rows(monthly)
+
+        if "modelo" not in ctx:
+            ctx["modelo"], ctx["feature_cols"] = train_global_regression(train)
+        ctx.setdefault("feature_cols", get_feature_cols())
+        model, feature_cols = ctx["modelo"], ctx["feature_cols"]
+
+        pred_reg = concat_sorted(map_shards(
+            pool, predict_shard_job,
+            [(m, model, feature_cols) for m in shard_by_sku(monthly, len(shards))]
+        ), ["Código"])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    cost = etapas["cost"]
+    school = etapas["school"]
+    v07, v08, v09 = etapas["ventas_mes"]
+
+    if "estacionalidad_compra" not in ctx:
+        ctx["estacionalidad_compra"] = etapas["estacionalidad"]
+
+    features = etapas["features"]
+    if "percentiles" not in ctx:
+        ctx["percentiles"] = behavior_percentiles(features)
+    ctx.setdefault("features", features)
+    segmentation = segment_behavior(features, *ctx["percentiles"])
+
+    if "residual_q" not in ctx:
+        ctx["residual_q"] = build_residual_quantiles(train, model, feature_cols, segmentation)
+    if "costo_global" not in ctx:
+        ctx["costo_global"] = global_average_cost(hist)
+
+    gmm_error = None
+    if diagnostico:
+        clusters, gmm_error = catalog_gmm_clusters(ctx)
+        segmentation = segmentation.drop(columns=["Cluster_GMM", "Confianza_GMM"]).merge(
+            clusters, on="Código", how="left"
+        )[SEGMENTATION_COLS]
+    else:
+        school = school[["Código", "Demanda_Mensual_Historica"]]
+        segmentation = segmentation[["Código", "Segmento_GMM"]]
+
+    final = vs.merge(school, on="Código", how="left")
+    final = final.merge(cost, on="Código", how="left")
+    final = final.merge(v07, on="Código", how="left")
+    final = final.merge(v08, on="Código", how="left")
+    final = final.merge(v09, on="Código", how="left")
+    final = final.merge(pred_reg, on="Código", how="left")
+    final = final.merge(segmentation, on="Código", how="left")
+
+    final["V07_2025"] = final["V07_2025"].fillna(0)
+    final["V08_2025"] = final["V08_2025"].fillna(0)
+    final["V09_2025"] = final["V09_2025"].fillna(0)
+    if diagnostico:
+        final["Tipo"] = final["Tipo"].fillna("SIN_HISTORICO")
+
+    final = fill_missing_costs_with_global_average(final, hist, global_cost=ctx["costo_global"])
+
+    final["Demanda_Mensual_Historica"] = final["Demanda_Mensual_Historica"].fillna(final["V30D"])
+    final["Pred_Regresion_Mensual"] = final["Pred_Regresion_Mensual"].fillna(final["Demanda_Mensual_Historica"])
+
+    final = apply_dynamic_profile_params(final, diagnostico=diagnostico)
+    final = apply_regression_safety(final)
+
+    final["Demanda_Base_Modelo"] = (
+        final["Peso_Regresion_Dyn"] * final["Pred_Regresion_Usable"] +
+        final["Peso_V30D_Dyn"] * final["V30D"]
+    ).clip(lower=0)
+
+    return final, gmm_error
+
+
+def apply_purchase_policy(base, ctx, fecha_corte=None, diagnostico=False):
+    """
+    Estacionalidad del mes de planeación, demanda a 30 días y compra.
+    Solo operaciones vectorizadas sobre `base`: volver a planear para otro mes
+    no recalcula features, Ridge ni estacionalidad.
+    """
+    final = base.copy()
+
+    final["Factor_Estacional_Compra"] = seasonality_for_months(
+        ctx["estacionalidad_compra"], final["Código"], [current_month(fecha_corte)]
+    ).to_numpy()[:, 0]
+
+    final["Factor_Estacional_Compra"] = np.where(
+        final["V30D"] >= 3,
+        np.maximum(final["Factor_Estacional_Compra"], 1.0),
+        final["Factor_Estacional_Compra"]
+    )
+
+    if USAR_ESTACIONALIDAD:
+        final["Demanda_Ajustada_Estacional"] = final["Demanda_Base_Modelo"] * final["Factor_Estacional_Compra"]
+    else:
+        final["Demanda_Ajustada_Estacional"] = final["Demanda_Base_Modelo"]
+
+    final = apply_demand_uncertainty(final, ctx["residual_q"])
+
+    final["Demanda30"] = np.ceil(final["Demanda_Ajustada_Estacional"]).clip(lower=0)
+
+    final["Demanda30"] = np.where(
+        (final["V30D"] > 0) & (final["Demanda30"] == 0),
+        np.ceil(final["V30D"] * 0.30),
+        final["Demanda30"]
+    )
+
+    final["Objetivo_Stock"] = final["Demanda30"]
+    if USAR_STOCK_SEGURIDAD:
+        final["Objetivo_Stock"] = final["Demanda30"] + final["Stock_Seguridad"]
+
+    final["Compra_Base"] = final["Objetivo_Stock"] - final["Stock"]
+
+    final["Compra_Base"] = np.where(
+        final["Stock"] >= final["Objetivo_Stock"],
+        0,
+        final["Compra_Base"]
+    )
+
+    final["Compra_Base"] = final["Compra_Base"].clip(lower=0)
+
+    final["Compra_Base"] = np.where(
+        (final["Compra_Base"] == 0) &
+        (final["V30D"] > MIN_ROTACION_V30D) &
+        (final["Stock"] < final["Objetivo_Stock"]),
+        COMPRA_MINIMA_UNIDAD,
+        final["Compra_Base"]
+    )
+
+    final["Compra"] = final["Compra_Base"].apply(round_normal)
+
+    final["Relacion_Compra_Demanda"] = np.where(
+        final["Demanda30"] > 0,
+        final["Compra"] / final["Demanda30"],
+        0
+    )
+
+    if diagnostico:
+        final = add_purchase_diagnostics(final)
+
+    return final
+
+
+def add_purchase_diagnostics(final):
+    final["Porcentaje_Compra_Demanda"] = (
+        final["Relacion_Compra_Demanda"] * 100
+    ).round(1)
+
+    final["Cobertura"] = np.where(
+        final["Demanda30"] > 0,
+        final["Stock"] / final["Demanda30"],
+        1
+    )
+
+    final["Nivel"] = coverage_level(final["Cobertura"])
+
+    return final
+
+
+def coverage_level(cobertura):
+    return np.select(
+        [cobertura < COBERTURA_NIVEL_CRITICO, cobertura < COBERTURA_NIVEL_MEDIO],
+        ["CRITICO", "MEDIO"],
+        "SANO"
+    )
+
+
+def catalog_gmm_clusters(ctx):
+    """GMM del catálogo completo; se ajusta la primera vez que se pide y queda en `ctx`."""
+    if "gmm" not in ctx:
+        ctx["gmm"], ctx["gmm_error"], ctx["gmm_modelo"] = fit_gmm_clusters(
+            ctx["features"], modelo=ctx.get("gmm_modelo")
+        )
+    return ctx["gmm"], ctx["gmm_error"]
+
+
+def explain_sku(codigo, vs, hist, contexto, feature_store=None, fecha_corte=None):
+    """
+    Desglose completo de diagnóstico de un SKU, calculado bajo demanda.
+    Usa el estado de catálogo de `contexto` (el de la corrida que produjo la
+    tabla), así que los números coinciden con la tabla aunque solo se procese el
+    histórico de ese SKU. Devuelve una Serie con todas las columnas intermedias.
+    """
+    codigo = str(codigo).strip().upper()
+    vs_sku = vs[vs["Código"] == codigo]
+    if vs_sku.empty:
+        raise ValueError(f"El código {codigo} no está en el archivo Erply.")
+
+    hist_sku = hist[hist["Código"] == codigo]
+    monthly_features = None
+    if feature_store is not None:
+        monthly_features = feature_store.load(codigos=[codigo])
+
+    final, _ = build_purchase_frame(
+        vs_sku, hist_sku, contexto=contexto, diagnostico=True, monthly_features=monthly_features,
+        fecha_corte=fecha_corte, particiones=1,
+    )
+    detalle = final.iloc[0].copy()
+
+    if USAR_LIMPIEZA_HISTORIA:
+        marcas = clean_history(hist_sku)["Limpieza"]
+        detalle["Meses_Pico"] = int((marcas == "PICO").sum())
+        detalle["Meses_Quiebre"] = int((marcas == "QUIEBRE").sum())
+
+    return detalle
+
+
+def finalize_purchase_table(final):
+    """Filtra los SKUs a comprar y deja solo las columnas que se muestran y exportan."""
+    final = final[
+        (final["Compra"] > 0) &
+        (final["Relacion_Compra_Demanda"] >= final["Umbral_Compra_Demanda_Dyn"])
+    ].copy()
+
+    final["Costo"] = final["Costo"].round(2)
+    final["Importe"] = (final["Compra"] * final["Costo"]).round(2)
+
+    # Columnas finales: solo las solicitadas (ver info_de_compra.txt).
+    # El resto (Tipo, Cluster_GMM, Confianza_GMM, Revisar_GMM, métricas de
+    # diagnóstico, etc.) ya no se calcula en el camino normal: se obtiene por SKU
+    # con explain_sku.
+    columnas = [
+        "Código",
+        "EAN",
+        "Nombre",
+        "Compra",
+        "Stock",
+        "Demanda30",
+        "V30D",
+        "V07_2025",
+        "V08_2025",
+        "V09_2025",
+        
+        "Costo",
+        "Importe",
+        "Segmento_GMM",
+    ]
+    if USAR_STOCK_SEGURIDAD:
+        columnas.insert(columnas.index("Demanda30") + 1, "Stock_Seguridad")
+    if "Traspaso_Entrada" in final.columns:
+        columnas.insert(columnas.index("Compra") + 1, "Traspaso_Entrada")
+
+    tabla = final[columnas].copy()
+
+    tabla["Costo"] = tabla["Costo"].round(2)
+    tabla["Importe"] = tabla["Importe"].round(2)
+
+    tabla = tabla.sort_values("Importe", ascending=False).reset_index(drop=True)
+
+    return tabla
@@ -0,0 +1,175 @@
+"""
+Precálculo programable (cron / Programador de tareas): corre el pipeline completo
+con el último histórico y Erply y publica el resultado en la caché local para que
+la UI abra directo sobre el plan.
+"""
+import json
+import os
+import pickle
+import shutil
+
+import pandas as pd
+
+from .config import APP_VERSION, DIR_CACHE, USAR_FEATURE_STORE
+from .helpers import write_atomic_json
+from .ingesta import HistoryStore, prepare_hist, read_erply, read_hist
+from .features import MonthlyFeatureStore
+from .politica import apply_purchase_policy, build_sku_base, catalog_gmm_clusters, finalize_purchase_table
+from .exportacion import input_fingerprint
+from .artefacto import CLAVES_ARTEFACTO, load_model_artifact, save_model_artifact
+
+
+# =========================
+# PRECALCULO EN CACHE
+# =========================
+def precompute_dir():
+    return os.path.join(DIR_CACHE, "precalculo")
+
+
+def precompute_manifest_path():
+    return os.path.join(precompute_dir(), "manifest.json")
+
+
+def precompute_feature_store(historico):
+    """
+    Feature store propio del precálculo: el de la UI (.cache/features) puede estar
+    leyéndose en una sesión abierta mientras el precálculo lo reconstruye. Solo se
+    usa con el histórico local; con un archivo completo (ventana móvil) cada mes
+    nuevo lo reconstruiría entero.
+    """
+    if not USAR_FEATURE_STORE or not isinstance(historico, HistoryStore):
+        return None
+    return MonthlyFeatureStore(os.path.join(precompute_dir(), "features"))
+
+
+def precompute_key(historico, erply):
+    """Misma huella que la sesión de la UI: contenido de las entradas + versión."""
+    if isinstance(historico, HistoryStore):
+        return input_fingerprint(historico.meta_path, erply)
+    return input_fingerprint(historico, erply)
+
+
+def read_precompute_manifest():
+    path = precompute_manifest_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != APP_VERSION:
+        return None
+    return manifest
+
+
+def manifest_inputs(manifest):
+    """Entradas registradas en el manifiesto (HistoryStore o ruta, y ruta del Erply)."""
+    entradas = manifest["entradas"]
+    if entradas.get("historico_local"):
+        return HistoryStore(entradas["historico_local"]), entradas["erply"]
+    return entradas["historico"], entradas["erply"]
+
+
+def precompute_is_stale(manifest):
+    """True si las entradas del manifiesto cambiaron (o ya no existen) desde el precálculo."""
+    historico, erply = manifest_inputs(manifest)
+    try:
+        return precompute_key(historico, erply) != manifest["clave"]
+    except OSError:
+        return True
+
+
+def run_precompute(historico, erply, fecha_corte=None, solo_si_cambio=False):
+    """
+    `historico` es una ruta (xlsx/csv/parquet) o un HistoryStore. Ajusta Ridge,
+    segmentación, GMM y estacionalidad, arma la tabla del mes de planeación y
+    publica todo en `.cache/precalculo`: el modelo ajustado como artefacto
+    (modelo-<clave>) y los datos de la corrida en un pickle. El manifiesto se
+    escribe al final, así que la UI nunca ve un precálculo a medias. Devuelve
+    (manifiesto, calculado); con `solo_si_cambio` no recalcula si las entradas
+    y el mes de planeación son los del último precálculo.
+    """
+    erply = os.path.abspath(erply)
+    if not isinstance(historico, HistoryStore):
+        historico = os.path.abspath(historico)
+    clave = precompute_key(historico, erply)
+
+    fecha_corte = pd.Timestamp(fecha_corte or pd.Timestamp.today())
+
+    # Mismas entradas pero otro mes (p. ej. el cron del día 1) también recalcula.
+    previo = read_precompute_manifest()
+    if (
+        solo_si_cambio and previo is not None and previo["clave"] == clave
+        and previo["fecha_corte"][:7] == f"{fecha_corte:%Y-%m}"
+    ):
+        return previo, False
+
+    local = isinstance(historico, HistoryStore)
+    hist = historico.load() if local else prepare_hist(read_hist(historico))
+    vs = read_erply(erply)
+
+    feature_store = precompute_feature_store(historico)
+
+    contexto = {}
+    base, _ = build_sku_base(vs, hist, contexto, feature_store=feature_store)
+    catalog_gmm_clusters(contexto)
+    tabla = finalize_purchase_table(apply_purchase_policy(base, contexto, fecha_corte=fecha_corte))
+
+    os.makedirs(precompute_dir(), exist_ok=True)
+    modelo = f"modelo-{clave[:16]}"
+    save_model_artifact(contexto, os.path.join(precompute_dir(), modelo), clave)
+
+    archivo = f"resultado-{clave[:16]}.pkl"
+    destino = os.path.join(precompute_dir(), archivo)
+    datos = {k: v for k, v in contexto.items() if k not in CLAVES_ARTEFACTO}
+    with open(destino + ".tmp", "wb") as fh:
+        pickle.dump(
+            {"clave": clave, "vs": vs, "hist": hist, "contexto": datos, "base": base,
+             "tabla": tabla, "fecha_corte": fecha_corte},
+            fh, protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(destino + ".tmp", destino)
+
+    manifest = {
+        "version": APP_VERSION,
+        "clave": clave,
+        "archivo": archivo,
+        "modelo": modelo,
+        "creado": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "fecha_corte": f"{fecha_corte:%Y-%m-%d}",
+        "entradas": {
+            "historico": None if local else historico,
+            "historico_local": os.path.abspath(historico.path) if local else None,
+            "erply": erply,
+        },
+        "skus": int(len(vs)),
+        "skus_compra": int(len(tabla)),
+        "importe": round(float(tabla["Importe"].fillna(0).sum()), 2),
+    }
+    write_atomic_json(precompute_manifest_path(), manifest)
+
+    for viejo in os.listdir(precompute_dir()):
+        ruta = os.path.join(precompute_dir(), viejo)
+        if viejo.startswith("resultado-") and viejo.endswith(".pkl") and viejo != archivo:
+            os.remove(ruta)
+        elif viejo.startswith("modelo-") and viejo != modelo and os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+
+    return manifest, True
+
+
+def precompute_model_path(manifest):
+    return os.path.join(precompute_dir(), manifest["modelo"])
+
+
+def load_precompute(manifest):
+    """
+    Resultado publicado: clave, vs, hist, contexto, base, tabla y fecha_corte.
+    El contexto une los datos de la corrida con el artefacto del modelo (en
+    memory map, sin el GMM: los clusters del catálogo ya vienen calculados).
+    """
+    with open(os.path.join(precompute_dir(), manifest["archivo"]), "rb") as fh:
+        publicado = pickle.load(fh)
+    if manifest.get("modelo"):
+        publicado["contexto"].update(
+            load_model_artifact(precompute_model_path(manifest), clave=manifest["clave"], con_gmm=False)
+        )
+    return publicado
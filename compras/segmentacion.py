@@ -0,0 +1,463 @@
+"""
+Segmentación por comportamiento (reglas) y GMM de diagnóstico.
+
+scikit-learn se importa solo al ajustar o cargar un GMM.
+"""
+import os
+import pickle
+
+import pandas as pd
+import numpy as np
+
+from .config import (
+    APP_VERSION, DIR_CACHE, GMM_COMPONENTES, GMM_CONFIANZA_MINIMA, GMM_COSTO_COVARIANZA, GMM_DESPLAZAMIENTO_MAX,
+    GMM_MIN_SKUS, GMM_N_INIT, GMM_RANDOM_STATE, GMM_RANGO_COMPONENTES, GMM_SELECCION_BIC,
+    GMM_TIPOS_COVARIANZA, GMM_WORKERS, MIN_MESES_PARA_ESTACIONAL, MIN_MESES_PARA_REGRESION,
+    PARAMETROS_PERFIL, USAR_SEGMENTACION_GMM,
+)
+from .helpers import clean_numeric_series, process_pool
+
+
+# =========================
+# SEGMENTACION GMM + METRICAS OBSERVABLES
+# =========================
+def slope_last(values):
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return 0.0
+    x = np.arange(len(values), dtype=float)
+    try:
+        return float(np.polyfit(x, values, 1)[0])
+    except Exception:
+        return 0.0
+
+
+def behavior_window(hist):
+    """Las últimas 24 fechas (mes) del catálogo completo."""
+    periodos = hist[["Año", "Mes"]].drop_duplicates()
+    fechas = sorted(pd.to_datetime(
+        periodos["Año"].astype(str) + "-" + periodos["Mes"].astype(str).str.zfill(2) + "-01"
+    ).unique())
+    return fechas[-24:] if len(fechas) >= 24 else fechas
+
+
+def build_sku_behavior_features(hist, fechas=None):
+    monthly = (
+        hist.groupby(["Código", "Año", "Mes"], as_index=False)
+        .agg({"Ventas": "sum", "Importe": "sum"})
+    )
+
+    if monthly.empty:
+        return pd.DataFrame(columns=[
+            "Código", "Venta_Total_24M", "Importe_Total_24M", "Promedio_Mensual",
+            "Venta_3M", "Venta_6M", "CV", "Meses_Con_Venta",
+            "Indice_Estacional", "Tendencia_6M"
+        ])
+
+    monthly["Fecha"] = pd.to_datetime(
+        monthly["Año"].astype(str) + "-" + monthly["Mes"].astype(str).str.zfill(2) + "-01"
+    )
+
+    ultimas_fechas = behavior_window(hist) if fechas is None else list(fechas)
+    monthly = monthly[monthly["Fecha"].isin(ultimas_fechas)].copy()
+
+    skus = pd.DataFrame({"Código": monthly["Código"].unique()})
+    fechas_df = pd.DataFrame({"Fecha": ultimas_fechas})
+    base = skus.assign(key=1).merge(fechas_df.assign(key=1), on="key").drop(columns="key")
+
+    base["Año"] = pd.to_datetime(base["Fecha"]).dt.year
+    base["Mes"] = pd.to_datetime(base["Fecha"]).dt.month
+
+    full = base.merge(
+        monthly[["Código", "Fecha", "Ventas", "Importe"]],
+        on=["Código", "Fecha"],
+        how="left"
+    )
+    full["Ventas"] = full["Ventas"].fillna(0)
+    full["Importe"] = full["Importe"].fillna(0)
+    full = full.sort_values(["Código", "Fecha"])
+
+    rows = []
+    for codigo, g in full.groupby("Código"):
+        ventas = g["Ventas"].astype(float).values
+        importe = g["Importe"].astype(float).values
+
+        total = float(np.sum(ventas))
+        imp_total = float(np.sum(importe))
+        promedio = float(np.mean(ventas)) if len(ventas) else 0.0
+        std = float(np.std(ventas)) if len(ventas) else 0.0
+        cv = float(std / promedio) if promedio > 0 else 0.0
+        meses_con_venta = int(np.sum(ventas > 0))
+        venta_3m = float(np.sum(ventas[-3:])) if len(ventas) else 0.0
+        venta_6m = float(np.sum(ventas[-6:])) if len(ventas) else 0.0
+        tendencia_6m = slope_last(ventas[-6:]) if len(ventas) >= 2 else 0.0
+
+        by_month = g.groupby("Mes")["Ventas"].sum()
+        promedio_mes = float(by_month.mean()) if len(by_month) else 0.0
+        max_mes = float(by_month.max()) if len(by_month) else 0.0
+        indice_estacional = float(max_mes / promedio_mes) if promedio_mes > 0 else 1.0
+
+        rows.append({
+            "Código": codigo,
+            "Venta_Total_24M": total,
+            "Importe_Total_24M": imp_total,
+            "Promedio_Mensual": promedio,
+            "Venta_3M": venta_3m,
+            "Venta_6M": venta_6m,
+            "CV": cv,
+            "Meses_Con_Venta": meses_con_venta,
+            "Indice_Estacional": indice_estacional,
+            "Tendencia_6M": tendencia_6m,
+        })
+
+    return pd.DataFrame(rows)
+
+
+def classify_behavior(row, p25_prom, p75_prom):
+    promedio = float(row.get("Promedio_Mensual", 0) or 0)
+    cv = float(row.get("CV", 0) or 0)
+    meses = float(row.get("Meses_Con_Venta", 0) or 0)
+    tendencia = float(row.get("Tendencia_6M", 0) or 0)
+    estacional = float(row.get("Indice_Estacional", 1) or 1)
+    venta_6m = float(row.get("Venta_6M", 0) or 0)
+
+    crecimiento_min = max(0.5, promedio * 0.20)
+
+    if promedio <= 0 or meses <= 1:
+        return "SIN_HISTORICO"
+    if meses <= 3 or promedio <= max(0.20, p25_prom * 0.50):
+        return "BAJA_ROTACION_ESPORADICA"
+    if tendencia >= crecimiento_min and venta_6m >= max(3, promedio * 3):
+        return "DEMANDA_EN_CRECIMIENTO"
+    if tendencia <= -crecimiento_min and promedio >= max(0.5, p25_prom):
+        return "DEMANDA_EN_DESCENSO"
+    if promedio >= p75_prom and cv <= 1.10:
+        return "ALTA_ROTACION_ESTABLE"
+    # AJUSTE: antes pedía meses >= 4, lo cual dejaba pasar productos esporádicos
+    # cuyo índice estacional se dispara por azar al tener pocos datos.
+    # Ahora se exige un mínimo de MIN_MESES_PARA_ESTACIONAL (8) para confiar en la señal.
+    if estacional >= 2.00 and meses >= MIN_MESES_PARA_ESTACIONAL:
+        return "ESTACIONAL"
+    if cv >= 1.80:
+        return "ERRATICO_VARIABLE"
+    if promedio >= p75_prom:
+        return "ALTA_ROTACION_ESTABLE"
+
+    return "ERRATICO_VARIABLE"
+
+
+SEGMENTATION_COLS = [
+    "Código", "Segmento_GMM", "Cluster_GMM", "Confianza_GMM", "Politica_Compra",
+    "Promedio_Mensual", "CV", "Meses_Con_Venta", "Indice_Estacional", "Tendencia_6M"
+]
+
+
+def behavior_percentiles(features):
+    prom_pos = features.loc[features["Promedio_Mensual"] > 0, "Promedio_Mensual"]
+    p25_prom = float(prom_pos.quantile(0.25)) if not prom_pos.empty else 0.0
+    p75_prom = float(prom_pos.quantile(0.75)) if not prom_pos.empty else 0.0
+    return p25_prom, p75_prom
+
+
+def segment_behavior(features, p25_prom, p75_prom):
+    features = features.copy()
+
+    if features.empty:
+        features["Segmento_GMM"] = pd.Series(dtype=object)
+    else:
+        features["Segmento_GMM"] = features.apply(
+            lambda r: classify_behavior(r, p25_prom, p75_prom), axis=1
+        )
+
+    features["Cluster_GMM"] = -1
+    features["Confianza_GMM"] = 0.0
+    features["Politica_Compra"] = features["Segmento_GMM"].map(profile_params()["politica"]).fillna(
+        PARAMETROS_PERFIL["GLOBAL"]["politica"]
+    )
+    return features
+
+
+def gmm_feature_matrix(features):
+    gmm_cols = [
+        "Venta_Total_24M", "Promedio_Mensual", "Venta_3M", "Venta_6M",
+        "CV", "Meses_Con_Venta", "Indice_Estacional", "Tendencia_6M"
+    ]
+
+    X = features[gmm_cols].copy()
+    X["Venta_Total_24M"] = np.log1p(X["Venta_Total_24M"])
+    X["Promedio_Mensual"] = np.log1p(X["Promedio_Mensual"])
+    X["Venta_3M"] = np.log1p(X["Venta_3M"])
+    X["Venta_6M"] = np.log1p(X["Venta_6M"])
+    X["CV"] = X["CV"].clip(0, 10)
+    X["Indice_Estacional"] = X["Indice_Estacional"].clip(0, 10)
+    return X.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+
+def fit_gmm_clusters(features, modelo=None):
+    """
+    GMM estadístico sobre las features de comportamiento del catálogo.
+    Devuelve (clusters, gmm_error, modelo): clusters es un DataFrame
+    (Código, Cluster_GMM, Confianza_GMM) y modelo un dict con scaler y gmm.
+    Con GMM_SELECCION_BIC el modelo se elige por BIC y se reutiliza desde la
+    caché mientras la distribución de features del catálogo no se desplace.
+    Si se pasa `modelo` (p. ej. de un artefacto) solo se asignan los clusters.
+    """
+    out = pd.DataFrame({
+        "Código": features["Código"].values,
+        "Cluster_GMM": -1,
+        "Confianza_GMM": 0.0,
+    })
+
+    if not USAR_SEGMENTACION_GMM or len(features) < GMM_MIN_SKUS:
+        return out, None, None
+
+    try:
+        from sklearn.mixture import GaussianMixture
+        from sklearn.preprocessing import StandardScaler
+
+        X = gmm_feature_matrix(features).values
+
+        if modelo is None and GMM_SELECCION_BIC:
+            modelo = load_cached_gmm(X)
+        if modelo is None:
+            scaler = StandardScaler().fit(X)
+            X_scaled = scaler.transform(X)
+
+            if GMM_SELECCION_BIC:
+                gmm = select_gmm_model(X_scaled)
+            else:
+                n_components = min(GMM_COMPONENTES, max(2, len(features) // 10))
+                gmm = GaussianMixture(
+                    n_components=n_components,
+                    covariance_type="full",
+                    random_state=GMM_RANDOM_STATE,
+                    n_init=5,
+                    reg_covar=1e-6,
+                ).fit(X_scaled)
+
+            modelo = {"scaler": scaler, "gmm": gmm}
+            if GMM_SELECCION_BIC:
+                save_cached_gmm(modelo, X)
+
+        probs = modelo["gmm"].predict_proba(modelo["scaler"].transform(X))
+
+        out["Cluster_GMM"] = probs.argmax(axis=1).astype(int)
+        out["Confianza_GMM"] = probs.max(axis=1)
+    except Exception as e:
+        # AJUSTE: antes el error se tragaba en silencio. Ahora se devuelve
+        # para que la UI muestre un aviso visible al usuario.
+        return out, str(e), None
+
+    return out, None, modelo
+
+
+_GMM_X = None
+
+
+def init_gmm_worker(X):
+    global _GMM_X
+    _GMM_X = X
+
+
+def fit_gmm_candidate(tarea):
+    """Worker: un reinicio de un candidato (componentes, covarianza, semilla)."""
+    from sklearn.mixture import GaussianMixture
+
+    n_components, covariance_type, seed = tarea
+    gmm = GaussianMixture(
+        n_components=n_components,
+        covariance_type=covariance_type,
+        random_state=seed,
+        n_init=1,
+        reg_covar=1e-6,
+    ).fit(_GMM_X)
+    return n_components, covariance_type, gmm.lower_bound_, gmm.bic(_GMM_X), gmm
+
+
+def gmm_workers(workers=GMM_WORKERS):
+    return workers or os.cpu_count() or 1
+
+
+def gmm_candidate_grid(n_skus, workers):
+    """
+    Candidatos (componentes, covarianzas, reinicios) que caben en el tiempo del GMM
+    fijo por núcleo (ver GMM_COSTO_COVARIANZA). Si no alcanza, primero se bajan los
+    reinicios, luego se quitan tipos de covarianza del final y al final se espacia
+    la rejilla de componentes.
+    """
+    max_componentes = max(2, n_skus // 10)
+    componentes = [k for k in GMM_RANGO_COMPONENTES if k <= max_componentes] or [2]
+    covarianzas = list(GMM_TIPOS_COVARIANZA)
+    n_init = GMM_N_INIT
+    presupuesto = workers * GMM_N_INIT * GMM_COMPONENTES
+
+    def costo(ks, covs, reinicios):
+        return reinicios * sum(k * GMM_COSTO_COVARIANZA.get(c, 1.0) for k in ks for c in covs)
+
+    while n_init > 1 and costo(componentes, covarianzas, n_init) > presupuesto:
+        n_init -= 1
+    while len(covarianzas) > 1 and costo(componentes, covarianzas, n_init) > presupuesto:
+        covarianzas.pop()
+    paso = 1
+    while len(componentes[::paso]) > 1 and costo(componentes[::paso], covarianzas, n_init) > presupuesto:
+        paso += 1
+
+    return componentes[::paso], covarianzas, n_init
+
+
+def select_gmm_model(X_scaled, workers=GMM_WORKERS):
+    """
+    Ajusta los candidatos de gmm_candidate_grid (todo GMM_RANGO_COMPONENTES x
+    GMM_TIPOS_COVARIANZA x GMM_N_INIT si hay núcleos suficientes) en un pool de
+    procesos. Por candidato se queda el reinicio con mejor verosimilitud (como
+    n_init) y entre candidatos, el de menor BIC. Los resultados se recorren en el
+    orden de las tareas, así que la elección no depende de qué proceso termina primero.
+    """
+    workers = gmm_workers(workers)
+    componentes, covarianzas, n_init = gmm_candidate_grid(len(X_scaled), workers)
+    tareas = [
+        (k, cov, GMM_RANDOM_STATE + i)
+        for k in componentes
+        for cov in covarianzas
+        for i in range(n_init)
+    ]
+
+    workers = min(workers, len(tareas))
+    if workers > 1:
+        with process_pool(workers, initializer=init_gmm_worker, initargs=(X_scaled,)) as pool:
+            resultados = list(pool.map(fit_gmm_candidate, tareas))
+    else:
+        init_gmm_worker(X_scaled)
+        resultados = [fit_gmm_candidate(t) for t in tareas]
+
+    mejores = {}
+    for k, cov, lower_bound, bic, gmm in resultados:
+        if (k, cov) not in mejores or lower_bound > mejores[(k, cov)][0]:
+            mejores[(k, cov)] = (lower_bound, bic, gmm)
+
+    return min(mejores.values(), key=lambda r: r[1])[2]
+
+
+def gmm_cache_path():
+    return os.path.join(DIR_CACHE, "gmm_modelo.pkl")
+
+
+def feature_distribution(X):
+    return {"media": X.mean(axis=0), "desv": X.std(axis=0), "n": int(len(X))}
+
+
+def distribution_shift(referencia, X):
+    """Mayor desplazamiento entre features: de la media (en desviaciones) o de la escala (log)."""
+    actual = feature_distribution(X)
+    escala = np.where(referencia["desv"] > 1e-9, referencia["desv"], 1.0)
+    media = np.abs(actual["media"] - referencia["media"]) / escala
+    desv = np.abs(np.log((actual["desv"] + 1e-9) / (referencia["desv"] + 1e-9)))
+    return float(max(media.max(), desv.max()))
+
+
+def gmm_cache_params(X):
+    """Lo que define al GMM elegido además de los datos: si cambia, la caché no sirve."""
+    componentes, covarianzas, n_init = gmm_candidate_grid(len(X), gmm_workers())
+    return {
+        "componentes": list(componentes),
+        "covarianzas": list(covarianzas),
+        "n_init": n_init,
+        "random_state": GMM_RANDOM_STATE,
+    }
+
+
+def load_cached_gmm(X):
+    path = gmm_cache_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as fh:
+            cached = pickle.load(fh)
+    except Exception:
+        return None
+
+    if cached.get("version") != APP_VERSION or len(cached["referencia"]["media"]) != X.shape[1]:
+        return None
+    if cached.get("parametros") != gmm_cache_params(X):
+        return None
+    if distribution_shift(cached["referencia"], X) > GMM_DESPLAZAMIENTO_MAX:
+        return None
+    return cached["modelo"]
+
+
+def save_cached_gmm(modelo, X):
+    os.makedirs(DIR_CACHE, exist_ok=True)
+    path = gmm_cache_path()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        pickle.dump(
+            {"version": APP_VERSION, "parametros": gmm_cache_params(X), "referencia": feature_distribution(X),
+             "modelo": modelo}, fh
+        )
+    os.replace(tmp, path)
+
+
+def build_gmm_segmentation(hist, ajustar_gmm=True):
+    """
+    Devuelve (features, gmm_error).
+    El GMM (Cluster_GMM / Confianza_GMM) se calcula como apoyo estadístico/diagnóstico.
+    La política de compra real sale de Segmento_GMM, que es una clasificación por reglas
+    (basada en percentiles del catálogo completo) para evitar que un cambio de cluster
+    de una corrida a otra altere la lógica de compras.
+    """
+    features = build_sku_behavior_features(hist)
+
+    if features.empty:
+        return pd.DataFrame(columns=SEGMENTATION_COLS), None
+
+    features = segment_behavior(features, *behavior_percentiles(features))
+
+    gmm_error = None
+    if ajustar_gmm:
+        clusters, gmm_error, _ = fit_gmm_clusters(features)
+        features["Cluster_GMM"] = clusters["Cluster_GMM"].values
+        features["Confianza_GMM"] = clusters["Confianza_GMM"].values
+
+    return features[SEGMENTATION_COLS], gmm_error
+
+
+def profile_params():
+    return pd.DataFrame(PARAMETROS_PERFIL).T
+
+
+def apply_dynamic_profile_params(final, diagnostico=True):
+    final = final.copy()
+
+    final["Segmento_GMM"] = final["Segmento_GMM"].fillna("SIN_HISTORICO")
+
+    params = profile_params()
+    segmento = final["Segmento_GMM"].where(final["Segmento_GMM"].isin(params.index), "GLOBAL")
+    p = params.reindex(segmento.values)
+
+    final["Peso_Regresion_Dyn"] = p["peso_regresion"].astype(float).values
+    final["Peso_V30D_Dyn"] = p["peso_v30d"].astype(float).values
+    final["Max_Factor_Hist_Dyn"] = p["max_hist"].astype(float).values
+    final["Max_Factor_V30D_Dyn"] = p["max_v30d"].astype(float).values
+    final["Umbral_Compra_Demanda_Dyn"] = p["umbral"].astype(float).values
+
+    poco_hist = final["Meses_Historial"].fillna(0) < MIN_MESES_PARA_REGRESION
+    final.loc[poco_hist, "Peso_Regresion_Dyn"] = np.minimum(final.loc[poco_hist, "Peso_Regresion_Dyn"], 0.20)
+    final.loc[poco_hist, "Peso_V30D_Dyn"] = 1.0 - final.loc[poco_hist, "Peso_Regresion_Dyn"]
+    final.loc[poco_hist, "Max_Factor_Hist_Dyn"] = np.minimum(final.loc[poco_hist, "Max_Factor_Hist_Dyn"], 1.5)
+    final.loc[poco_hist, "Umbral_Compra_Demanda_Dyn"] = np.maximum(final.loc[poco_hist, "Umbral_Compra_Demanda_Dyn"], 0.40)
+
+    if not diagnostico:
+        return final
+
+    final["Confianza_GMM"] = clean_numeric_series(final["Confianza_GMM"])
+    final["Politica_Compra"] = final["Politica_Compra"].fillna(PARAMETROS_PERFIL["GLOBAL"]["politica"])
+
+    # AJUSTE: bandera informativa para revisión manual cuando el GMM estadístico
+    # tuvo baja confianza en su agrupación. No cambia la compra, solo marca para revisar.
+    final["Revisar_GMM"] = np.where(
+        (final["Cluster_GMM"].fillna(-1) >= 0) & (final["Confianza_GMM"] < GMM_CONFIANZA_MINIMA),
+        "SI",
+        "NO"
+    )
+
+    return final
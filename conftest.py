@@ -0,0 +1 @@
+"""La raíz del repositorio queda en sys.path para que los tests importen `compras`."""
@@ -0,0 +1,15 @@
+"""Presupuesto de importación del núcleo (lo mismo que `python -m compras arranque`)."""
+from compras.cli import measure_core_import
+from compras.config import PRESUPUESTO_IMPORTACION_S
+
+
+def test_core_import_within_budget():
+    # Se toma la más rápida de tres medidas, como el comando, para no fallar por ruido.
+    medidas = [measure_core_import() for _ in range(3)]
+    mejor = min(medidas, key=lambda m: m["base"] + m["compras"])
+    assert mejor["base"] + mejor["compras"] <= PRESUPUESTO_IMPORTACION_S
+
+
+def test_core_import_loads_no_heavy_modules():
+    medida = measure_core_import()
+    assert medida["pesados"] == [], f"Módulos pesados al importar compras: {medida['pesados']}"
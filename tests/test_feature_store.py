@@ -0,0 +1,70 @@
+"""MonthlyFeatureStore: agregar meses debe dar las mismas features que calcularlas de cero."""
+import pandas as pd
+import pytest
+
+from compras.comparacion import move_units_last_month, synthetic_inputs
+from compras.features import MonthlyFeatureStore, build_monthly_features
+from compras.ingesta import prepare_hist
+
+
+@pytest.fixture(scope="module")
+def hist():
+    hist, _ = synthetic_inputs(n_skus=80, semilla=3, fecha_corte="2026-10-01", meses=18)
+    return prepare_hist(hist)
+
+
+def periodo(hist):
+    return hist["Año"] * 12 + hist["Mes"]
+
+
+def assert_same_features(obtenido, esperado):
+    def ordenar(df):
+        return df.sort_values(["Código", "Fecha"]).reset_index(drop=True)[sorted(esperado.columns)]
+
+    pd.testing.assert_frame_equal(ordenar(obtenido), ordenar(esperado), check_dtype=False)
+
+
+def test_append_month_by_month_matches_full_build(hist, tmp_path, monkeypatch):
+    store = MonthlyFeatureStore(str(tmp_path))
+    meses = sorted(periodo(hist).unique())
+    store.update(hist[periodo(hist) <= meses[12]])
+
+    # A partir de aquí cada mes nuevo se agrega sin reconstruir.
+    def sin_reconstruir(*args, **kwargs):
+        raise AssertionError("el almacén se reconstruyó al agregar un mes")
+
+    monkeypatch.setattr(store, "rebuild", sin_reconstruir)
+    for mes in meses[13:]:
+        monthly, train = store.update(hist[periodo(hist) <= mes])
+
+    esperado_monthly, esperado_train = build_monthly_features(hist)
+    assert_same_features(monthly, esperado_monthly)
+    assert_same_features(train, esperado_train)
+
+
+def test_append_handles_skus_that_start_late(hist, tmp_path):
+    ultimo = periodo(hist).max()
+    nuevo = hist[periodo(hist) == ultimo].head(3).assign(Código="SKU_NUEVO")
+    completo = pd.concat([hist, nuevo], ignore_index=True)
+
+    store = MonthlyFeatureStore(str(tmp_path))
+    store.update(hist[periodo(hist) < ultimo])
+    monthly, _ = store.update(completo)
+
+    assert_same_features(monthly, build_monthly_features(completo)[0])
+
+
+@pytest.mark.parametrize("caso", ["correccion_mes", "ventana_movil"])
+def test_changed_or_retired_month_rebuilds(hist, tmp_path, caso):
+    store = MonthlyFeatureStore(str(tmp_path))
+    store.update(hist)
+
+    if caso == "correccion_mes":
+        # Mismo total del mes: solo el hash de contenido detecta el cambio.
+        nuevo = move_units_last_month(hist)
+    else:
+        nuevo = hist[periodo(hist) > periodo(hist).min()]
+
+    monthly, _ = store.update(nuevo)
+    assert_same_features(monthly, build_monthly_features(nuevo)[0])
+    assert_same_features(store.load()[0], build_monthly_features(nuevo)[0])
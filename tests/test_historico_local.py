@@ -0,0 +1,69 @@
+"""HistoryStore: carga inicial, deltas mensuales y filas que nunca cambian."""
+import pandas as pd
+import pytest
+
+from compras.ingesta import HistoryStore
+
+
+def history(filas):
+    return pd.DataFrame(filas, columns=["Código", "Año", "Mes", "Ventas", "Importe"])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "historico"))
+    store.replace(history([
+        ("A", 2025, 1, 3, 30.0),
+        ("B", 2025, 1, 1, 15.0),
+        ("A", 2025, 2, 2, 20.0),
+    ]))
+    return store
+
+
+def test_append_new_month(store):
+    resumen = store.append(history([("a ", 2025, 3, 4, 40.0), ("B", 2025, 3, 2, 30.0)]))
+
+    assert resumen == {"mes": "2025-03", "nuevas": 2, "duplicadas": 0}
+    assert store.months() == ["2025-01", "2025-02", "2025-03"]
+    hist = store.load()
+    # El código se normaliza igual que en prepare_hist.
+    assert hist.loc[(hist["Año"] == 2025) & (hist["Mes"] == 3), "Código"].tolist() == ["A", "B"]
+
+
+def test_append_keeps_stored_rows(store):
+    # A ya existe en 2025-02: se descarta; B es nuevo en ese mes y se agrega.
+    resumen = store.append(history([("A", 2025, 2, 99, 990.0), ("B", 2025, 2, 5, 75.0)]))
+
+    assert resumen == {"mes": "2025-02", "nuevas": 1, "duplicadas": 1}
+    febrero = store.load().query("Mes == 2").set_index("Código")
+    assert febrero.loc["A", "Ventas"] == 2
+    assert febrero.loc["B", "Ventas"] == 5
+    assert store.read_meta()["meses"]["2025-02"]["filas"] == 2
+
+
+def test_append_only_duplicates_writes_nothing(store):
+    antes = store.read_meta()
+    resumen = store.append(history([("A", 2025, 1, 7, 70.0)]))
+
+    assert resumen == {"mes": "2025-01", "nuevas": 0, "duplicadas": 1}
+    assert store.read_meta() == antes
+
+
+def test_append_consolidates_repeated_keys(store):
+    resumen = store.append(history([("C", 2025, 3, 1, 10.0), ("C", 2025, 3, 2, 20.0)]))
+
+    assert resumen["nuevas"] == 1
+    marzo = store.load().query("Mes == 3")
+    assert marzo["Ventas"].tolist() == [3]
+    assert marzo["Importe"].tolist() == [30.0]
+
+
+def test_append_rejects_multi_month_delta(store):
+    with pytest.raises(ValueError, match="un solo mes"):
+        store.append(history([("A", 2025, 3, 1, 10.0), ("A", 2025, 4, 1, 10.0)]))
+    assert store.months() == ["2025-01", "2025-02"]
+
+
+def test_append_rejects_missing_columns(store):
+    with pytest.raises(ValueError, match="Importe"):
+        store.append(pd.DataFrame({"Código": ["A"], "Año": [2025], "Mes": [3], "Ventas": [1]}))
@@ -0,0 +1,83 @@
+"""Limpieza de picos y quiebres sobre la matriz SKU x mes."""
+import numpy as np
+import pandas as pd
+
+from compras.config import LIMPIEZA_ESCALA_MIN, LIMPIEZA_K_MAD, MIN_NIVEL_QUIEBRE
+from compras.limpieza import clean_history, clean_sales_matrix
+
+
+def flat_series(nivel=10.0, meses=12):
+    return np.full((1, meses), nivel)
+
+
+def test_spike_is_capped():
+    x = flat_series()
+    x[0, 8] = 100.0
+    limpio, marca = clean_sales_matrix(x)
+
+    assert marca[0, 8] == 1
+    # Serie plana: MAD 0, el tope es la mediana con la escala mínima.
+    assert limpio[0, 8] == 10.0 * (1 + LIMPIEZA_K_MAD * LIMPIEZA_ESCALA_MIN)
+    assert (marca[0, np.arange(12) != 8] == 0).all()
+
+
+def test_zero_month_is_imputed_as_stockout():
+    x = flat_series(nivel=max(MIN_NIVEL_QUIEBRE, 6.0))
+    x[0, 7] = 0.0
+    limpio, marca = clean_sales_matrix(x)
+
+    assert marca[0, 7] == 2
+    assert limpio[0, 7] == x[0, 6]
+
+
+def test_missing_month_is_left_alone():
+    x = flat_series()
+    x[0, 7] = np.nan
+    limpio, marca = clean_sales_matrix(x)
+
+    assert np.isnan(limpio[0, 7])
+    assert (marca == 0).all()
+
+
+def test_recurring_seasonal_peak_is_kept():
+    x = flat_series(meses=24)
+    x[0, [6, 18]] = [60.0, 70.0]
+    limpio, marca = clean_sales_matrix(x)
+
+    # Sin año anterior el primer pico se recorta; el del año siguiente es temporada.
+    assert marca[0, 6] == 1
+    assert marca[0, 18] == 0
+    assert limpio[0, 18] == 70.0
+
+
+def test_new_months_do_not_change_cleaned_ones():
+    rng = np.random.default_rng(0)
+    x = rng.poisson(8, size=(50, 24)).astype(float)
+    x[rng.random(x.shape) < 0.05] = np.nan
+    x[rng.random(x.shape) < 0.03] *= 10
+
+    completo, marca_completa = clean_sales_matrix(x)
+    parcial, marca_parcial = clean_sales_matrix(x[:, :18])
+
+    np.testing.assert_array_equal(completo[:, :18], parcial)
+    np.testing.assert_array_equal(marca_completa[:, :18], marca_parcial)
+
+
+def test_clean_history_keeps_rows_and_raw_series():
+    meses = pd.period_range("2024-01", periods=12, freq="M")
+    hist = pd.DataFrame({
+        "Código": ["A"] * 12 + ["B"] * 12,
+        "Año": list(meses.year) * 2,
+        "Mes": list(meses.month) * 2,
+        "Ventas": [10.0] * 8 + [100.0] + [10.0] * 3 + [5.0] * 12,
+        "Importe": [100.0] * 8 + [1000.0] + [100.0] * 3 + [50.0] * 12,
+    })
+    out = clean_history(hist)
+
+    assert len(out) == len(hist)
+    assert out["Ventas_Raw"].tolist() == hist["Ventas"].tolist()
+    assert list(out["Limpieza"]).count("PICO") == 1
+    pico = out["Limpieza"] == "PICO"
+    # El pico conserva el precio de la fila.
+    assert (out.loc[pico, "Importe"] / out.loc[pico, "Ventas"]).iloc[0] == 10.0
+    assert out.loc[~pico, "Ventas"].tolist() == hist.loc[~pico, "Ventas"].tolist()
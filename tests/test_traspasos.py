@@ -0,0 +1,96 @@
+"""plan_stock_transfers contra un emparejamiento por fuerza bruta, SKU por SKU."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from compras.config import COBERTURA_EXCEDENTE, COBERTURA_NIVEL_CRITICO, COBERTURA_RETENER_DONANTE
+from compras.multitienda import plan_stock_transfers
+
+
+def random_frames(semilla, n_tiendas=4, n_skus=40):
+    rng = np.random.default_rng(semilla)
+    codigos = [f"SKU{i:03d}" for i in range(n_skus)]
+    frames = {}
+    for t in range(n_tiendas):
+        # Cada tienda maneja un subconjunto del catálogo; algunos SKUs sin demanda.
+        filas = rng.random(n_skus) < 0.8
+        demanda = rng.integers(0, 12, n_skus).astype(float)
+        stock = rng.integers(-2, 40, n_skus).astype(float)
+        compra = rng.integers(0, 15, n_skus).astype(float)
+        frames[f"T{t}"] = pd.DataFrame({
+            "Código": np.array(codigos)[filas],
+            "Stock": stock[filas],
+            "Demanda30": demanda[filas],
+            "Compra": compra[filas],
+        })
+    return frames
+
+
+def brute_force_transfers(frames):
+    """
+    Mismo criterio que plan_stock_transfers con ciclos simples: por SKU, los
+    receptores (menor cobertura primero) toman de los donantes (mayor oferta
+    primero) hasta agotar pedido u oferta.
+    """
+    receptores, donantes = {}, {}
+    for tienda, f in frames.items():
+        for codigo, stock, demanda, compra in f[["Código", "Stock", "Demanda30", "Compra"]].itertuples(index=False):
+            stock = max(stock, 0.0)
+            cobertura = stock / demanda if demanda > 0 else np.inf
+            if cobertura < COBERTURA_NIVEL_CRITICO and demanda > 0 and compra > 0:
+                receptores.setdefault(codigo, []).append([cobertura, tienda, int(compra)])
+            if cobertura > COBERTURA_EXCEDENTE:
+                oferta = int(np.floor(stock - np.ceil(demanda * COBERTURA_RETENER_DONANTE)))
+                if oferta > 0:
+                    donantes.setdefault(codigo, []).append([oferta, tienda, oferta])
+
+    traspasos = {}
+    for codigo in receptores:
+        if codigo not in donantes:
+            continue
+        rec = sorted((list(r) for r in receptores[codigo]), key=lambda r: (r[0], r[1]))
+        don = sorted((list(d) for d in donantes[codigo]), key=lambda d: (-d[0], d[1]))
+        i = j = 0
+        while i < len(rec) and j < len(don):
+            cantidad = min(rec[i][2], don[j][2])
+            clave = (codigo, don[j][1], rec[i][1])
+            traspasos[clave] = traspasos.get(clave, 0) + cantidad
+            rec[i][2] -= cantidad
+            don[j][2] -= cantidad
+            if rec[i][2] == 0:
+                i += 1
+            if don[j][2] == 0:
+                j += 1
+    return traspasos, receptores, donantes
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_plan_stock_transfers_matches_brute_force(semilla):
+    frames = random_frames(semilla)
+    traspasos = plan_stock_transfers(frames)
+    esperado, receptores, donantes = brute_force_transfers(frames)
+
+    obtenido = traspasos.groupby(["Código", "Tienda_Origen", "Tienda_Destino"])["Cantidad"].sum().to_dict()
+    assert obtenido == esperado
+
+    # Por SKU se traspasa min(pedido, oferta) y nadie recibe ni cede de más.
+    por_sku = traspasos.groupby("Código")["Cantidad"].sum()
+    for codigo in set(receptores) | set(donantes):
+        pedido = sum(r[2] for r in receptores.get(codigo, []))
+        oferta = sum(d[2] for d in donantes.get(codigo, []))
+        assert por_sku.get(codigo, 0) == min(pedido, oferta)
+
+    pedidos = {(c, r[1]): r[2] for c, rs in receptores.items() for r in rs}
+    ofertas = {(c, d[1]): d[2] for c, ds in donantes.items() for d in ds}
+    for (codigo, destino), recibido in traspasos.groupby(["Código", "Tienda_Destino"])["Cantidad"].sum().items():
+        assert recibido <= pedidos[(codigo, destino)]
+    for (codigo, origen), cedido in traspasos.groupby(["Código", "Tienda_Origen"])["Cantidad"].sum().items():
+        assert cedido <= ofertas[(codigo, origen)]
+
+    assert (traspasos["Tienda_Origen"] != traspasos["Tienda_Destino"]).all()
+    assert (traspasos["Cantidad"] > 0).all()
+
+
+def test_plan_stock_transfers_single_store_is_empty():
+    frames = random_frames(0, n_tiendas=1)
+    assert plan_stock_transfers(frames).empty